@@ -3,6 +3,8 @@ import numpy as np
 from datetime import datetime, timedelta
 import geopy.distance
 import gc
+import os
+import json
 from tqdm import tqdm_notebook
 
 def get_last_games(df, data, team_name, n = 5, filter="all", verbose=False):
@@ -430,155 +432,520 @@ def cria_features(new_games, all_games = None, dist_matrix_path="../old_files/di
     return(new_games)
     
     
-def gera_last_N_games(new_games, all_games = None, N = [5],
-                      to_drop=["fl_win", "Total_passes", "result", "Accurate passes", "hora", "game"]):
+def str_percentage_to_float(x):
     """
-        Gera as variáveis em relação ao desempenho médio nos últimos N jogos nas visões LAST_GAMES, AS_HOME, AS_AWAY e RIVALS.
+        Converte um percentual em texto ('46%') para float (0.46)
+    """
+    x = str(x).replace("%", "")
+    return(float(x)/100)
+
+def split_statistics(base, coluna, new_name, drop_old=True):
+    """
+        Separa as estatísticas no formato 'X (Y%)' ou 'X/Z (Y%)' em colunas numéricas.
+        Cria 'Total_<new_name>' (ou 'Completed_<new_name>' e 'Attempted_<new_name>') e '<new_name>_accuracy' nas visões home e away.
         
         Parâmetros:
-            all_games: DataFrame com as informações do desempenho dos dois times por jogo. Tipicamente após aplicar as funções 'prepara_base()' e 'cria_features()'
-            new_games: DataFrame com os novos jogos a serem computados os desempenhos passados. Deve conter as colunas 'team_home', 'team_away', 'DATE' e 'GAME'
-                    N: Lista com os tamanhos de janelas dos últimos jogos a serem observados
+              base: DataFrame com os dados dos jogos
+            coluna: Nome da estatística sem o sufixo '_home'/'_away' (ex.: 'Accurate passes')
+          new_name: Nome base das novas colunas
+          drop_old: (Boolean) Remove as colunas originais
     """
+    for side in ["_home", "_away"]:
+        valores = base[coluna + side].fillna("0 (0%)").astype(str)
+        partes = valores.str.extract(r"^\s*(\d+)(?:/(\d+))?\s*(?:\((\d+)%\))?")
+        
+        if partes[1].notna().any():
+            base["Attempted_" + new_name + side] = partes[1].fillna(0).astype(int)
+            base["Completed_" + new_name + side] = partes[0].fillna(0).astype(int)
+        else:
+            base["Total_" + new_name + side] = partes[0].fillna(0).astype(int)
+        
+        base[new_name + "_accuracy" + side] = partes[2].fillna(0).astype(float) / 100
     
-    gc.enable()
-    resp = []
-    
-    if(all_games is None):
-        all_games = new_games.copy()
-    
-    home_columns = [x for x in all_games.columns if x.endswith("_home") and x not in ['GAME_ID_home', 'TEAM_CITY_home', 'GAME_DATE_home', 'GAME_PLACE_home', 'TEAM_NICKNAME_home']]
-    away_columns = [x for x in all_games.columns if x.endswith("_away") and x not in ['TEAM_CITY_away', 'TEAM_NICKNAME_away']]
+    if drop_old:
+        base.drop([coluna + "_away", coluna + "_home"], axis=1, inplace=True)
 
-    pbar = tqdm_notebook(total=len(new_games))
-    
+def pos_neg_counts(a):
+    """
+        Retorna o tamanho das sequências de valores positivos e negativos consecutivos de um array
+    """
+    mask = a > 0
+    idx = np.flatnonzero(mask[1:] != mask[:-1])
     try:
-        for index, row in new_games.reset_index().iterrows():
-            game_line_n = []
-            for n_games in N:
-                # Home team
-                home_last_games = get_last_games(all_games, row["data"], row["team_home"], n=n_games)
-                home_last_games_as_home = get_last_games(all_games, row["data"], row["team_home"], filter="home", n=n_games)
-
-                home_avg_last_games = get_avg_last_games(home_last_games, row["team_home"], home_columns, away_columns, data_ref=row["data"], to_drop=to_drop)
-                home_avg_last_games_as_home = get_avg_last_games(home_last_games_as_home, row["team_home"], home_columns, away_columns, data_ref=row["data"], to_drop=to_drop)
-                home_rivals_last_games = get_avg_last_games(home_last_games, row["team_home"], home_columns, away_columns, rivals=True, data_ref=row["data"], to_drop=to_drop)
-
-                home_avg_last_games["game_ref"] = [row["game"]]
-                home_avg_last_games.set_index("game_ref", inplace=True)
-                home_avg_last_games.drop(["team_home", "team_away", 0] + to_drop, axis=1, errors="ignore", inplace=True)
-
-                home_avg_last_games_as_home["game_ref"] = [row["game"]]
-                home_avg_last_games_as_home.set_index("game_ref", inplace=True)
-                home_avg_last_games_as_home.drop(["team_home", "team_away", 0], axis=1, errors="ignore", inplace=True)
-
-                home_rivals_last_games["game_ref"] = [row["game"]]
-                home_rivals_last_games.set_index("game_ref", inplace=True)
-                home_rivals_last_games.drop(["team_home", "team_away", 0], axis=1, errors="ignore", inplace=True)
-
-                #print(home_rivals_last_games.index, home_avg_last_games.index)
-
-                # Away team
-                away_last_games = get_last_games(all_games, row["data"], row["team_away"], n=n_games).reset_index()
-                away_last_games_as_away = get_last_games(all_games, row["data"], row["team_away"], filter="away", n=n_games).reset_index()
-
-                away_avg_last_games = get_avg_last_games(away_last_games, row["team_away"], home_columns, away_columns, data_ref=row["data"], to_drop=to_drop)
-                away_avg_last_games_as_away = get_avg_last_games(away_last_games_as_away, row["team_away"], home_columns, away_columns, data_ref=row["data"], to_drop=to_drop)
-                away_rivals_last_games = get_avg_last_games(away_last_games, row["team_away"], home_columns, away_columns, rivals=True, data_ref=row["data"], to_drop=to_drop)
-
-                away_avg_last_games["game_ref"] = [row["game"]]
-                away_avg_last_games.set_index("game_ref", inplace=True)
-                away_avg_last_games.drop(["team_home", "team_away", 0] + to_drop,axis=1 ,errors="ignore", inplace=True)
-
-                away_avg_last_games_as_away["game_ref"] = [row["game"]]
-                away_avg_last_games_as_away.set_index("game_ref", inplace=True)
-                away_avg_last_games_as_away.drop(["team_home", "team_away", 0] + to_drop,axis=1 ,errors="ignore", inplace=True)
-
-                away_rivals_last_games["game_ref"] = [row["game"]]
-                away_rivals_last_games.set_index("game_ref", inplace=True)
-                away_rivals_last_games.drop(["team_home", "team_away", 0] + to_drop,axis=1 ,errors="ignore", inplace=True)
-
-                #print(away_rivals_last_games.index, away_avg_last_games.index)
-
-                # Junta bases 
+        count = np.concatenate(( [idx[0]+1], idx[1:] - idx[:-1], [a.size-1-idx[-1]] ))
+        if a[0]<0:
+            return count[1::2], count[::2] # pos, neg counts
+        else:
+            return count[::2], count[1::2] # pos, neg counts
+    except IndexError:
+        return np.array([92]), np.array([0])
 
-                if (n_games == 10000):
-                    n_games_str = "ALL"
-                else:
-                    n_games_str = str(n_games)
+def cria_features_form_minute(base, i):
+    """
+        Cria as variáveis de domínio do jogo a partir da pressão por minuto ('form_minute_*') da linha i da base
+    """
+    r = {}
+    
+    cols = [x for x in base.columns if "form_minute" in x]
+    linha = base.iloc[i][cols].astype(float)
+    
+    # ----------
+    # Dominance 
+    # ----------
+    # Home
+    home_dom = linha[linha > 0]
+    r["minutes_dominant_home"] = len(home_dom)
+    r["total_dominance_home"] = home_dom.sum()
+    r["avg_dominance_home"] = home_dom.mean()
+    r["max_dominance_home"] = home_dom.max()
+    r["min_dominance_home"] = home_dom.min()
+    r["std_dominance_home"] = home_dom.std()
+    
+    # Away
+    away_dom = linha[linha < 0] * -1
+    r["minutes_dominant_away"] = len(away_dom)
+    r["total_dominance_away"] = away_dom.sum()
+    r["avg_dominance_away"] = away_dom.mean()
+    r["max_dominance_away"] = away_dom.max()
+    r["min_dominance_away"] = away_dom.min()
+    r["std_dominance_away"] = away_dom.std()
+    
+    # -----------------
+    # Minutes Sequence
+    # -----------------
+    pos_counts, neg_counts = pos_neg_counts(np.array(linha))
+    # Home
+    r["max_minutes_sequence_dominant_home"] = max(pos_counts, default=0)
+    r["std_minutes_sequence_dominant_home"] = np.std(pos_counts)
+    
+    # Away
+    r["max_minutes_sequence_dominant_away"] = max(neg_counts, default=0)
+    r["std_minutes_sequence_dominant_away"] = np.std(neg_counts)
+    
+    # ----------------
+    # Comparing Teams
+    # ----------------
+    r["minutes_draw"] = len(linha[linha == 0])
+    
+    return(r)
 
-                avg_last_games = home_avg_last_games.join(away_avg_last_games, how="inner", 
-                                     lsuffix='_home_L' + n_games_str, rsuffix='_away_L' + n_games_str).drop('level_0', axis=1, errors="ignore")
+def prepara_base_sofa_score(base, period="ALL"):
+    """
+        Faz a preparação da base 'game_data_*.csv' vinda do scrap do SofaScore, como feito no notebook 'Prep Data'.
+        Mantém as estatísticas de um único período, converte os textos em números e cria as variáveis de resultado,
+        de dias desde o último jogo e de domínio por minuto.
+        
+        Parâmetros:
+              base: DataFrame lido do arquivo 'game_data_*.csv'
+            period: Período das estatísticas a manter: 'ALL', '1ST' ou '2ND'
+    """
+    base = base.copy()
+    base["data"] = pd.to_datetime(base["data"], format="%Y-%m-%d")
+    
+    # Mantém apenas o período escolhido, sem o sufixo
+    periodos = ["_ALL", "_1ST", "_2ND"]
+    base = base[[x for x in base.columns if not any(x.endswith(p) for p in periodos) or x.endswith("_" + period)]]
+    base.columns = [x[:-len("_" + period)] if x.endswith("_" + period) else x for x in base.columns]
+    
+    for coluna, new_name in [("Accurate passes", "Passes"), ("Crosses", "Crosses"), ("Dribbles", "Dribbles"),
+                             ("Long balls", "Long_balls"), ("Tackles", "Tackles")]:
+        if coluna + "_home" in base.columns and base[coluna + "_home"].dtype == object:
+            split_statistics(base, coluna, new_name)
+    
+    if "Ball possession_home" in base.columns:
+        base["Ball possession_away"] = base["Ball possession_away"].fillna("0%").apply(str_percentage_to_float)
+        base["Ball possession_home"] = base["Ball possession_home"].fillna("0%").apply(str_percentage_to_float)
+    
+    base.fillna(0, inplace=True)
+    base = base.sort_values("data", kind="mergesort").reset_index(drop=True)
+    
+    # Variáveis de resposta
+    base["fl_home_win"] = base["result"].apply(lambda x: (x == 1) * 1)
+    base["fl_away_win"] = base["result"].apply(lambda x: (x == -1) * 1)
+    base["fl_draw"] = base["result"].apply(lambda x: (x == 0) * 1)
+    
+    # Variáveis de dias
+    base["DAYS_FROM_LAST_GAME_home"] = [get_days_from_last_game(base, x.data, x.team_home) 
+                                        for x in base.itertuples()]
+    base["DAYS_FROM_LAST_GAME_away"] = [get_days_from_last_game(base, x.data, x.team_away) 
+                                        for x in base.itertuples()]
+    
+    # Variáveis de pressão por minuto
+    if any("form_minute" in x for x in base.columns):
+        temp = pd.DataFrame.from_dict([cria_features_form_minute(base, i) for i in range(len(base))])
+        base = pd.concat([base, temp], axis=1)
+    
+    return(base)
 
-                avg_last_games_as = home_avg_last_games_as_home.join(away_avg_last_games_as_away, how="inner", 
-                                         lsuffix='_home_L' + n_games_str + '_AS_HOME', rsuffix='_away_L' + n_games_str + '_AS_AWAY').drop('level_0', axis=1, errors="ignore")
+def _monta_linha_janela(row, n_games, janelas, to_drop):
+    """
+        Junta as médias das visões LAST_GAMES, AS_HOME, AS_AWAY e RIVALS de um jogo em uma única linha para a janela 'n_games'.
+        
+        Parâmetros:
+                row: Series com o jogo em referência. Deve conter 'game', 'team_home', 'team_away' e 'data'
+            n_games: Tamanho da janela dos últimos jogos
+            janelas: Dicionário com os DataFrames de 'get_avg_last_games()' nas chaves 'home', 'home_as_home', 'home_rivals',
+                     'away', 'away_as_away' e 'away_rivals'
+            to_drop: (List) Colunas a desconsiderar
+    """
+    drop_home = ["team_home", "team_away", 0] + to_drop
+    drop_as_home = ["team_home", "team_away", 0]
+    
+    # Home team
+    home_avg_last_games = janelas["home"].assign(game_ref=[row["game"]]).set_index("game_ref").drop(drop_home, axis=1, errors="ignore")
+    home_avg_last_games_as_home = janelas["home_as_home"].assign(game_ref=[row["game"]]).set_index("game_ref").drop(drop_as_home, axis=1, errors="ignore")
+    home_rivals_last_games = janelas["home_rivals"].assign(game_ref=[row["game"]]).set_index("game_ref").drop(drop_as_home, axis=1, errors="ignore")
+    
+    # Away team
+    away_avg_last_games = janelas["away"].assign(game_ref=[row["game"]]).set_index("game_ref").drop(drop_home, axis=1, errors="ignore")
+    away_avg_last_games_as_away = janelas["away_as_away"].assign(game_ref=[row["game"]]).set_index("game_ref").drop(drop_home, axis=1, errors="ignore")
+    away_rivals_last_games = janelas["away_rivals"].assign(game_ref=[row["game"]]).set_index("game_ref").drop(drop_home, axis=1, errors="ignore")
+
+    # Junta bases 
+    if (n_games == 10000):
+        n_games_str = "ALL"
+    else:
+        n_games_str = str(n_games)
 
+    avg_last_games = home_avg_last_games.join(away_avg_last_games, how="inner", 
+                         lsuffix='_home_L' + n_games_str, rsuffix='_away_L' + n_games_str).drop('level_0', axis=1, errors="ignore")
 
-                rivals_last_games = home_rivals_last_games.join(away_rivals_last_games, how="inner",
-                                        lsuffix='_home_L' + n_games_str + '_RIVALS', rsuffix='_away_L' + n_games_str + '_RIVALS').drop('level_0', axis=1, errors="ignore")
+    avg_last_games_as = home_avg_last_games_as_home.join(away_avg_last_games_as_away, how="inner", 
+                             lsuffix='_home_L' + n_games_str + '_AS_HOME', rsuffix='_away_L' + n_games_str + '_AS_AWAY').drop('level_0', axis=1, errors="ignore")
 
+    rivals_last_games = home_rivals_last_games.join(away_rivals_last_games, how="inner",
+                            lsuffix='_home_L' + n_games_str + '_RIVALS', rsuffix='_away_L' + n_games_str + '_RIVALS').drop('level_0', axis=1, errors="ignore")
 
-                #print(rivals_last_games.columns)
+    game_line = avg_last_games.join(rivals_last_games, how="inner", rsuffix="_RIVALS")
 
-                game_line = avg_last_games.join(rivals_last_games, how="inner", rsuffix="_RIVALS")
+    game_line = game_line.join(avg_last_games_as, how="inner")
 
-                game_line = game_line.join(avg_last_games_as, how="inner")
+    return(pd.concat([row.to_frame().transpose().set_index("game"), game_line], axis=1))
 
-                game_line = pd.concat([row.to_frame().transpose().set_index("game"), game_line], axis=1)
+def _linha_last_N_games(index, row, all_games, N, home_columns, away_columns, to_drop):
+    """
+        Gera a linha com as variáveis dos últimos N jogos de um único jogo, juntando todas as janelas de 'N'.
+        Utilizado internamente pelo método 'gera_last_N_games()'.
+    """
+    game_line_n = []
+    for n_games in N:
+        # Home team
+        home_last_games = get_last_games(all_games, row["data"], row["team_home"], n=n_games)
+        home_last_games_as_home = get_last_games(all_games, row["data"], row["team_home"], filter="home", n=n_games)
+        
+        # Away team
+        away_last_games = get_last_games(all_games, row["data"], row["team_away"], n=n_games).reset_index()
+        away_last_games_as_away = get_last_games(all_games, row["data"], row["team_away"], filter="away", n=n_games).reset_index()
+        
+        janelas = {
+            "home": get_avg_last_games(home_last_games, row["team_home"], home_columns, away_columns, data_ref=row["data"], to_drop=to_drop),
+            "home_as_home": get_avg_last_games(home_last_games_as_home, row["team_home"], home_columns, away_columns, data_ref=row["data"], to_drop=to_drop),
+            "home_rivals": get_avg_last_games(home_last_games, row["team_home"], home_columns, away_columns, rivals=True, data_ref=row["data"], to_drop=to_drop),
+            "away": get_avg_last_games(away_last_games, row["team_away"], home_columns, away_columns, data_ref=row["data"], to_drop=to_drop),
+            "away_as_away": get_avg_last_games(away_last_games_as_away, row["team_away"], home_columns, away_columns, data_ref=row["data"], to_drop=to_drop),
+            "away_rivals": get_avg_last_games(away_last_games, row["team_away"], home_columns, away_columns, rivals=True, data_ref=row["data"], to_drop=to_drop)
+        }
 
-                print(str(index) + " " + str(row["game"]) + " L_" + str(n_games), end="\r")
+        game_line_n.append(_monta_linha_janela(row, n_games, janelas, to_drop))
 
-                game_line_n.append(game_line)
+        print(str(index) + " " + str(row["game"]) + " L_" + str(n_games), end="\r")
 
-            resp.append(game_line_n)
+    return(pd.concat(game_line_n, axis=1))
 
-            pbar.update(1)
+def _lista_chunks(output_path, output_format="csv"):
+    """
+        Retorna a lista ordenada dos arquivos de chunk já gravados em 'output_path'
+    """
+    if not os.path.isdir(output_path):
+        return([])
+    
+    return(sorted([os.path.join(output_path, x) for x in os.listdir(output_path) 
+                   if x.startswith("part_") and x.endswith("." + output_format)]))
 
-            del home_last_games
-            del home_last_games_as_home
-            del home_avg_last_games
-            del home_avg_last_games_as_home
-            del home_rivals_last_games
+def _le_chunk(path, output_format="csv", columns=None):
+    """
+        Lê um único chunk gravado pelo método 'gera_last_N_games()'
+    """
+    if(output_format == "parquet"):
+        return(pd.read_parquet(path, columns=columns))
+    
+    if columns is not None:
+        columns = [0] + columns
+    
+    return(pd.read_csv(path, sep=";", index_col=0, usecols=columns))
 
-            del away_last_games
-            del away_last_games_as_away
-            del away_avg_last_games
-            del away_avg_last_games_as_away
-            del away_rivals_last_games
+def _proximo_chunk_id(chunks):
+    """
+        Retorna o id do próximo chunk: o maior id já gravado + 1, para nunca sobrescrever um chunk existente
+        mesmo que algum chunk intermediário tenha sido apagado
+    """
+    if(len(chunks) == 0):
+        return(0)
+    
+    return(max(int(os.path.basename(x).split(".")[0][len("part_"):]) for x in chunks) + 1)
 
-            del avg_last_games
-            del avg_last_games_as
-            del game_line
-            del game_line_n
+def _verifica_manifesto(output_path, params):
+    """
+        Grava em 'output_path' um manifesto com os parâmetros da geração dos chunks ou, caso já exista, verifica se os
+        parâmetros são os mesmos. Chunks gerados com parâmetros diferentes teriam colunas diferentes, então a retomada
+        não é permitida nesse caso.
+    """
+    path = os.path.join(output_path, "_manifest.json")
+    
+    if os.path.exists(path):
+        with open(path, "r") as f:
+            gravado = json.load(f)
+        
+        if gravado != params:
+            raise ValueError("Os chunks em '" + output_path + "' foram gerados com outros parâmetros (" + str(gravado) + 
+                             "). Utilize outro 'output_path' para os parâmetros " + str(params))
+        return
+    
+    with open(path, "w") as f:
+        json.dump(params, f)
 
-            gc.collect()
-    except KeyboardInterrupt:
-        pbar.close()
+def _grava_chunk(buffer, output_path, chunk_id, output_format="csv"):
+    """
+        Grava as linhas em memória em um novo chunk e retorna o caminho do arquivo.
+        O arquivo é escrito com um nome temporário e renomeado ao final, de forma que um chunk interrompido no meio
+        da escrita nunca seja considerado na retomada.
+    """
+    chunk = pd.concat(buffer, sort=False)
+    chunk.index.name = "game"
+    
+    path = os.path.join(output_path, "part_%05d.%s" % (chunk_id, output_format))
+    tmp_path = path + ".tmp"
+    
+    if(output_format == "parquet"):
+        chunk.to_parquet(tmp_path)
+    else:
+        chunk.to_csv(tmp_path, sep=";")
     
-        resp2 = []
-        for r in resp:
-            resp2.append(pd.concat(r, axis=1))
+    os.replace(tmp_path, path)
+    return(path)
 
-        del resp
-        return(pd.concat(resp2))
+def le_chunks_last_N_games(output_path, output_format="csv"):
+    """
+        Junta em um único DataFrame todos os chunks gravados pelo método 'gera_last_N_games()' com 'output_path'
+        
+        Parâmetros:
+            output_path: Diretório com os chunks gravados
+          output_format: 'csv' ou 'parquet'
+    """
+    chunks = [_le_chunk(path, output_format) for path in _lista_chunks(output_path, output_format)]
+    
+    if(len(chunks) == 0):
+        return(pd.DataFrame())
+    
+    return(pd.concat(chunks, sort=False))
+    
+def _janelas_D_arrays(all_games, to_drop):
+    """
+        Monta a base na visão de cada time (uma linha por time por jogo), ordenada por time e data, com as estatísticas
+        do próprio time e do rival. Utilizado internamente pelo método 'gera_last_D_days()'.
+    """
+    stems = [x[:-len("_home")] for x in all_games.columns 
+             if x.endswith("_home") and x[:-len("_home")] + "_away" in all_games.columns
+             and x not in to_drop and x[:-len("_home")] + "_away" not in to_drop and x[:-len("_home")] not in to_drop
+             and pd.api.types.is_numeric_dtype(all_games[x]) 
+             and pd.api.types.is_numeric_dtype(all_games[x[:-len("_home")] + "_away"])]
+    
+    stats_home = all_games[[x + "_home" for x in stems]].to_numpy(dtype=float)
+    stats_away = all_games[[x + "_away" for x in stems]].to_numpy(dtype=float)
+    
+    dias = all_games["data"].values.astype("datetime64[D]").astype(np.int64)
+    
+    times, codigos = np.unique(np.concatenate([all_games["team_home"].astype(str).values, 
+                                               all_games["team_away"].astype(str).values]), return_inverse=True)
+    
+    long = {
+        "team": codigos,
+        "dia": np.concatenate([dias, dias]),
+        "fl_home": np.concatenate([np.ones(len(all_games), dtype=bool), np.zeros(len(all_games), dtype=bool)]),
+        "own": np.nan_to_num(np.concatenate([stats_home, stats_away])),
+        "opp": np.nan_to_num(np.concatenate([stats_away, stats_home]))
+    }
+    
+    ordem = np.lexsort((long["dia"], long["team"]))
+    for key in long:
+        long[key] = long[key][ordem]
+    
+    return(stems, {x: i for i, x in enumerate(times)}, long)
 
-    pbar.close()
+def gera_last_D_days(new_games, all_games = None, D = [14, 30, 90],
+                     to_drop = ["fl_win", "Total_passes", "result", "Accurate passes", "hora", "game"]):
+    """
+        Gera as variáveis em relação ao desempenho nos jogos dos últimos D dias (janela [data - D, data)) nas visões
+        LAST_GAMES, AS_HOME, AS_AWAY e RIVALS, com a média ('<var>_home_D30') e a soma ('SUM_<var>_home_D30') de cada
+        estatística e o número de jogos na janela ('N_GAMES_home_D30').
+        
+        Os jogos de cada time ficam em arrays ordenados por data com somas acumuladas, de forma que os limites de cada
+        janela são encontrados por 'searchsorted' para todos os jogos e todas as janelas de uma vez.
+        
+        Parâmetros:
+            new_games: DataFrame com os novos jogos. Deve conter as colunas 'game', 'team_home', 'team_away' e 'data'
+            all_games: DataFrame com os jogos históricos. Caso None, assume-se que 'new_games' possua o histórico também
+                    D: Lista com os tamanhos das janelas em dias
+              to_drop: (List) Colunas a desconsiderar
+    """
+    if(all_games is None):
+        all_games = new_games
+    
+    stems, codigo_time, long = _janelas_D_arrays(all_games, to_drop)
+    
+    dias_novos = new_games["data"].values.astype("datetime64[D]").astype(np.int64)
+    
+    # Chave única (time, dia) para buscar os limites das janelas de todos os times em um único array
+    offset = max(long["dia"].max(initial=0), dias_novos.max(initial=0)) + max(D + [0]) + 1
     
-    resp2 = []
-    for r in resp:
-        resp2.append(pd.concat(r, axis=1))
+    resp = {}
+    for side, coluna_time in [("home", "team_home"), ("away", "team_away")]:
+        team = np.array([codigo_time.get(str(x), -1) for x in new_games[coluna_time]])
         
-    del resp
-    gc.collect()
-    gc.disable()
+        for view, mask in [("", np.ones(len(long["team"]), dtype=bool)),
+                           ("_AS_HOME" if side == "home" else "_AS_AWAY", long["fl_home"] if side == "home" else ~long["fl_home"])]:
+            chave = long["team"][mask] * offset + long["dia"][mask]
+            own_acc = np.vstack([np.zeros((1, len(stems))), np.cumsum(long["own"][mask], axis=0)])
+            opp_acc = np.vstack([np.zeros((1, len(stems))), np.cumsum(long["opp"][mask], axis=0)])
+            
+            fim = np.searchsorted(chave, team * offset + dias_novos, side="left")
+            
+            for d_days in D:
+                inicio = np.searchsorted(chave, team * offset + dias_novos - d_days, side="left")
+                n_games = fim - inicio
+                
+                suffix = "_" + side + "_D" + str(d_days) + view
+                resp["N_GAMES" + suffix] = n_games
+                
+                visoes = [(suffix, own_acc)]
+                if(view == ""):
+                    visoes.append((suffix + "_RIVALS", opp_acc))
+                
+                for sfx, acc in visoes:
+                    soma = acc[fim] - acc[inicio]
+                    with np.errstate(invalid="ignore", divide="ignore"):
+                        media = soma / n_games[:, None]
+                    
+                    for i, stem in enumerate(stems):
+                        resp[stem + sfx] = media[:, i]
+                        resp["SUM_" + stem + sfx] = soma[:, i]
+    
+    return(pd.DataFrame(resp, index=pd.Index(new_games["game"].values, name="game")))
     
-    return(pd.concat(resp2))
+def gera_last_N_games(new_games, all_games = None, N = [5],
+                      to_drop=["fl_win", "Total_passes", "result", "Accurate passes", "hora", "game"],
+                      output_path = None, chunk_size = 500, max_memory_mb = None, output_format = "csv", D = None):
+    """
+        Gera as variáveis em relação ao desempenho médio nos últimos N jogos nas visões LAST_GAMES, AS_HOME, AS_AWAY e RIVALS.
+        
+        Caso 'output_path' seja informado, as linhas prontas são gravadas em disco em chunks ('part_00000.csv', ...)
+        ao invés de mantidas em memória, e o método retorna a lista dos chunks gravados. Os jogos já presentes nos chunks
+        do diretório são pulados, de forma que uma execução interrompida pode ser retomada chamando o método novamente.
+        Os parâmetros 'N', 'D', 'to_drop' e 'output_format' ficam gravados em '_manifest.json' e a retomada com parâmetros
+        diferentes gera um erro.
+        Os chunks podem ser lidos com o método 'le_chunks_last_N_games()'.
+        
+        Caso 'D' seja informado, as variáveis das janelas de dias do método 'gera_last_D_days()' são incluídas nas linhas.
+        
+        Parâmetros:
+            all_games: DataFrame com as informações do desempenho dos dois times por jogo. Tipicamente após aplicar as funções 'prepara_base()' e 'cria_features()'
+            new_games: DataFrame com os novos jogos a serem computados os desempenhos passados. Deve conter as colunas 'team_home', 'team_away', 'DATE' e 'GAME'
+                    N: Lista com os tamanhos de janelas dos últimos jogos a serem observados
+          output_path: Diretório onde gravar os chunks. Se None, retorna o DataFrame completo em memória
+           chunk_size: Número máximo de jogos por chunk
+        max_memory_mb: Limite (em MB) das linhas mantidas em memória antes de gravar um chunk. Se None, usa apenas 'chunk_size'
+        output_format: 'csv' ou 'parquet'
+                    D: Lista com os tamanhos das janelas em dias. Se None, gera apenas as janelas de N jogos
+    """
+    
+    if(all_games is None):
+        all_games = new_games.copy()
+    
+    janelas_D = None
+    if D:
+        janelas_D = gera_last_D_days(new_games, all_games, D=D, to_drop=to_drop)
+        janelas_D = janelas_D[~janelas_D.index.duplicated()]
+    
+    home_columns = [x for x in all_games.columns if x.endswith("_home") and x not in ['GAME_ID_home', 'TEAM_CITY_home', 'GAME_DATE_home', 'GAME_PLACE_home', 'TEAM_NICKNAME_home']]
+    away_columns = [x for x in all_games.columns if x.endswith("_away") and x not in ['TEAM_CITY_away', 'TEAM_NICKNAME_away']]
+    
+    new_games = new_games.reset_index()
+    
+    # ------------------------
+    # Modo em memória
+    # ------------------------
+    if output_path is None:
+        resp = []
+        pbar = tqdm_notebook(total=len(new_games))
+        
+        try:
+            for index, row in new_games.iterrows():
+                resp.append(_linha_last_N_games(index, row, all_games, N, home_columns, away_columns, to_drop))
+                pbar.update(1)
+        except KeyboardInterrupt:
+            pass
+        
+        pbar.close()
+        
+        if(len(resp) == 0):
+            return(pd.DataFrame())
+        
+        resp = pd.concat(resp)
+        if janelas_D is not None:
+            resp = resp.join(janelas_D)
+        
+        return(resp)
+    
+    # ------------------------
+    # Modo em chunks
+    # ------------------------
+    os.makedirs(output_path, exist_ok=True)
+    _verifica_manifesto(output_path, {"N": list(N), "D": list(D) if D else [], "to_drop": list(to_drop), 
+                                      "output_format": output_format})
+    
+    chunks = _lista_chunks(output_path, output_format)
+    gravados = set()
+    for path in chunks:
+        gravados.update(_le_chunk(path, output_format, columns=[]).index.astype(str))
+    
+    new_games = new_games[~new_games["game"].astype(str).isin(gravados)]
+    
+    buffer = []
+    buffer_bytes = 0
+    
+    pbar = tqdm_notebook(total=len(new_games))
+    
+    try:
+        for index, row in new_games.iterrows():
+            game_line = _linha_last_N_games(index, row, all_games, N, home_columns, away_columns, to_drop)
+            if janelas_D is not None:
+                game_line = game_line.join(janelas_D)
+            
+            buffer.append(game_line)
+            buffer_bytes += game_line.memory_usage(deep=True).sum()
+            pbar.update(1)
+            
+            if(len(buffer) >= chunk_size or 
+               (max_memory_mb is not None and buffer_bytes >= max_memory_mb * 1024 * 1024)):
+                chunks.append(_grava_chunk(buffer, output_path, _proximo_chunk_id(chunks), output_format))
+                buffer = []
+                buffer_bytes = 0
+                gc.collect()
+    except KeyboardInterrupt:
+        print("Interrompido. Gravando jogos já processados...")
+    finally:
+        if(len(buffer) > 0):
+            chunks.append(_grava_chunk(buffer, output_path, _proximo_chunk_id(chunks), output_format))
+        pbar.close()
+    
+    return(chunks)
 
 def variaveis_delta(df_resp, N = [5], to_predict = True, keep_features = ["team_home", "team_away", "DATE",  
                                                      'DISTANCE_KM_home', 'DISTANCE_KM_away', 'DAYS_FROM_LAST_GAME_home',
-                                                       'DAYS_FROM_LAST_GAME_away']):
+                                                       'DAYS_FROM_LAST_GAME_away'], D = []):
     """
-        Crias variáveis de Delta e Cross a partir da base com as features dos últimos N jogos do método 'gera_last_N_games()'.
+        Crias variáveis de Delta e Cross a partir da base com as features dos últimos N jogos do método 'gera_last_N_games()'
+        e, se informado 'D', das janelas de dias do método 'gera_last_D_days()' (ex.: 'D1_<var>_D30').
             D1: (HOME - AWAY) -> Desempenho do time da casa subtraído do desempenho do time visitante
             D2: (AS_HOME - AS_AWAY) -> Desempenho do time da casa nos últimos jogos home subtraído do desempenho do time visitante nos últimos jogos away
             C1: (OPP_HOME - AWAY) -> Desempenho dos times oponentes do time da casa nos últimos jogos subtraído do desempenho do visitante nos últimos jogos
@@ -587,6 +954,7 @@ def variaveis_delta(df_resp, N = [5], to_predict = True, keep_features = ["team_
         Parâmetros:
             df_resp: DataFrame dos jogos com as variáveis referente aos últimos jogos
                   N: Lista dos tamanhos das janelas a se criar as features de delta
+                  D: Lista dos tamanhos das janelas em dias a se criar as features de delta
       keep_features: Lista de features individuais dos jogos a serem mantidas na base resultante
     """
     columns_subtract = []
@@ -616,6 +984,21 @@ def variaveis_delta(df_resp, N = [5], to_predict = True, keep_features = ["team_
                 filtrada["C2_" + column + "_L" + n_games_str] = df_resp[column + "_opponent_away_L" + n_games_str] - df_resp[column + "_home_L" + n_games_str]
             except KeyError:
                 pass
+    
+    # Janelas de dias: C1 e C2 usam a visão RIVALS
+    deltas_D = {}
+    for d_days in D:
+        d_str = "_D" + str(d_days)
+        
+        for column in [x[:-len("_home" + d_str)] for x in df_resp.columns if x.endswith("_home" + d_str)]:
+            deltas_D["D1_" + column + d_str] = df_resp[column + "_home" + d_str] - df_resp[column + "_away" + d_str]
+            deltas_D["D2_" + column + d_str] = df_resp[column + "_home" + d_str + "_AS_HOME"] - df_resp[column + "_away" + d_str + "_AS_AWAY"]
+            if column + "_home" + d_str + "_RIVALS" in df_resp.columns:
+                deltas_D["C1_" + column + d_str] = df_resp[column + "_home" + d_str + "_RIVALS"] - df_resp[column + "_away" + d_str]
+                deltas_D["C2_" + column + d_str] = df_resp[column + "_away" + d_str + "_RIVALS"] - df_resp[column + "_home" + d_str]
+    
+    if(len(deltas_D) > 0):
+        filtrada = pd.concat([filtrada, pd.DataFrame(deltas_D, index=filtrada.index)], axis=1)
             
     return(filtrada)
 
@@ -0,0 +1,263 @@
+import pandas as pd
+import numpy as np
+from collections import OrderedDict
+
+from data_prep_functions import get_avg_last_games, _monta_linha_janela
+
+def fixtures_pendentes(links_path):
+    """
+        Retorna os jogos ainda não realizados (home_score == -1) de um arquivo da pasta 'links_sofa_score'
+
+        Parâmetros:
+            links_path: Caminho do arquivo 'sofa_score_links_*.csv'
+    """
+    links = pd.read_csv(links_path, sep=";")
+    links = links[links["home_score"] == -1].copy()
+    links["data"] = pd.to_datetime(links["date"], format="%d-%m-%Y")
+
+    return(links[["game", "fixture", "id", "team_home", "team_away", "data"]].reset_index(drop=True))
+
+ROLES = ["home", "home_as_home", "home_rivals", "away", "away_as_away", "away_rivals"]
+
+class FeatureServer:
+    """
+        Servidor em memória das variáveis dos últimos N jogos para jogos ainda não realizados.
+
+        O histórico da liga é carregado uma única vez e indexado por time e data, de forma que a busca dos últimos jogos
+        é feita por 'searchsorted' ao invés de filtrar a base inteira a cada jogo. As médias de cada janela são guardadas
+        em um cache LRU com chave (time, data, n, visão) já como vetores numéricos, reaproveitado entre jogos da mesma rodada
+        e entre chamadas. A posição de cada valor na linha final e os pares de colunas dos deltas são calculados uma única vez
+        (método '_layout()'), então montar a linha e os deltas de um jogo é apenas indexar e subtrair arrays.
+
+        As linhas geradas possuem as mesmas colunas do método 'gera_last_N_games()' com o mesmo 'to_drop', e os deltas as mesmas
+        colunas do método 'variaveis_delta()'.
+
+        Parâmetros:
+            all_games: DataFrame com os jogos históricos já preparados (mesma base usada em 'gera_last_N_games()')
+                    N: Lista com os tamanhos de janelas dos últimos jogos
+              to_drop: (List) Colunas a desconsiderar
+        keep_features: Lista de features individuais dos jogos mantidas na base de deltas
+           cache_size: Número máximo de janelas mantidas no cache
+    """
+
+    def __init__(self, all_games, N = [5],
+                 to_drop = ['fl_home_win', 'game', 'hora', 'result', 'data', 'index',
+                            'fl_away_win', 'fl_draw', 'fl_win_home'],
+                 keep_features = ["team_home", "team_away", "data"],
+                 cache_size = 4096):
+        self.N = N
+        self.to_drop = to_drop
+        self.keep_features = keep_features
+        self.cache_size = cache_size
+
+        self.all_games = all_games.sort_values("data", kind="mergesort").reset_index(drop=True)
+
+        self.home_columns = [x for x in self.all_games.columns if x.endswith("_home") and x not in ['GAME_ID_home', 'TEAM_CITY_home', 'GAME_DATE_home', 'GAME_PLACE_home', 'TEAM_NICKNAME_home']]
+        self.away_columns = [x for x in self.all_games.columns if x.endswith("_away") and x not in ['TEAM_CITY_away', 'TEAM_NICKNAME_away']]
+
+        # Posições dos jogos de cada time (já ordenadas por data) nas visões 'all', 'home' e 'away'
+        datas = self.all_games["data"].values
+        self._jogos_time = {}
+        for team in pd.unique(self.all_games[["team_home", "team_away"]].values.ravel()):
+            is_home = (self.all_games["team_home"] == team).values
+            is_away = (self.all_games["team_away"] == team).values
+
+            self._jogos_time[team] = {}
+            for view, mask in [("all", is_home | is_away), ("home", is_home), ("away", is_away)]:
+                pos = np.flatnonzero(mask)
+                self._jogos_time[team][view] = (pos, datas[pos])
+
+        self._cache = OrderedDict()
+        self._layouts = {}
+        self.hits = 0
+        self.misses = 0
+
+    def _last_games(self, team_name, data, n, filter="all"):
+        """
+            Equivalente ao método 'get_last_games()' utilizando os índices pré-calculados por time
+        """
+        if team_name not in self._jogos_time:
+            return(self.all_games.iloc[[]])
+
+        pos, datas = self._jogos_time[team_name][filter]
+        fim = np.searchsorted(datas, np.datetime64(data), side="left")
+
+        return(self.all_games.iloc[pos[max(fim - n, 0):fim]])
+
+    def janela(self, team_name, data, n, view):
+        """
+            Retorna a média do desempenho do time na janela dos últimos n jogos como (colunas, valores), usando o cache LRU
+
+            Parâmetros:
+                team_name: Nome do time
+                     data: Data de referência
+                        n: Tamanho da janela
+                     view: 'all', 'home', 'away' ou 'rivals'
+        """
+        key = (team_name, pd.Timestamp(data), n, view)
+
+        if key in self._cache:
+            self.hits += 1
+            self._cache.move_to_end(key)
+            return(self._cache[key])
+
+        self.misses += 1
+
+        last_games = self._last_games(team_name, data, n, filter="all" if view == "rivals" else view)
+        avg = get_avg_last_games(last_games, team_name, self.home_columns, self.away_columns,
+                                 rivals=(view == "rivals"), data_ref=data, to_drop=self.to_drop)
+        resp = (tuple(avg.columns), pd.to_numeric(avg.iloc[0], errors="coerce").to_numpy(dtype=float))
+
+        self._cache[key] = resp
+        if(len(self._cache) > self.cache_size):
+            self._cache.popitem(last=False)
+
+        return(resp)
+
+    def cache_info(self):
+        """
+            Retorna as estatísticas de uso do cache
+        """
+        return({"hits": self.hits, "misses": self.misses, "size": len(self._cache), "max_size": self.cache_size})
+
+    def limpa_cache(self):
+        """
+            Esvazia o cache de janelas e zera as estatísticas
+        """
+        self._cache.clear()
+        self.hits = 0
+        self.misses = 0
+
+    def _layout(self, assinatura):
+        """
+            Calcula, para um conjunto de colunas das janelas, os nomes das colunas da linha final e a posição de cada uma no
+            vetor com as janelas concatenadas, além dos índices das colunas subtraídas nos deltas.
+            Os nomes vêm do próprio '_monta_linha_janela()', aplicado uma única vez a janelas cujos valores são as posições.
+        """
+        if assinatura in self._layouts:
+            return(self._layouts[assinatura])
+
+        row = pd.Series({"game": "", "team_home": "", "team_away": "", "data": pd.NaT})
+        colunas = []
+        indices = []
+        offset = 0
+        for n_games, colunas_janelas in zip(self.N, assinatura):
+            janelas = {}
+            for role, cols in zip(ROLES, colunas_janelas):
+                janelas[role] = pd.DataFrame([np.arange(offset, offset + len(cols))], columns=list(cols))
+                offset += len(cols)
+
+            game_line = _monta_linha_janela(row, n_games, janelas, self.to_drop).drop(list(row.index), axis=1, errors="ignore")
+            colunas += list(game_line.columns)
+            indices += list(game_line.iloc[0].astype(int))
+
+        # Mesmas colunas de 'variaveis_delta()'
+        posicao = {x: i for i, x in enumerate(colunas)}
+        stems = sorted(set([x.replace("_home_L5_AS_HOME", "").replace("_home_L5_RIVALS", "").replace("_home_L5", "")
+                            for x in colunas if "_home_L5" in x]))
+        deltas = []
+        for stem in stems:
+            for n_games in self.N:
+                n_games_str = "ALL" if n_games == 10000 else str(n_games)
+                sfx = "_L" + n_games_str
+                pares = [("D1_", stem + "_home" + sfx, stem + "_away" + sfx),
+                         ("D2_", stem + "_home" + sfx + "_AS_HOME", stem + "_away" + sfx + "_AS_AWAY"),
+                         ("C1_", stem + "_opponent_home" + sfx, stem + "_away" + sfx),
+                         ("C2_", stem + "_opponent_away" + sfx, stem + "_home" + sfx)]
+                for prefixo, a, b in pares:
+                    if a in posicao and b in posicao:
+                        deltas.append((prefixo + stem + sfx, posicao[a], posicao[b]))
+
+        layout = {
+            "colunas": colunas,
+            "indices": np.array(indices, dtype=np.int64),
+            "delta_colunas": [x[0] for x in deltas],
+            "delta_a": np.array([x[1] for x in deltas], dtype=np.int64),
+            "delta_b": np.array([x[2] for x in deltas], dtype=np.int64)
+        }
+        self._layouts[assinatura] = layout
+
+        return(layout)
+
+    def _vetor(self, team_home, team_away, data):
+        """
+            Retorna o layout e o vetor com os valores da linha de um jogo
+        """
+        assinatura = []
+        valores = []
+        for n_games in self.N:
+            janelas = [self.janela(team_home, data, n_games, "all"),
+                       self.janela(team_home, data, n_games, "home"),
+                       self.janela(team_home, data, n_games, "rivals"),
+                       self.janela(team_away, data, n_games, "all"),
+                       self.janela(team_away, data, n_games, "away"),
+                       self.janela(team_away, data, n_games, "rivals")]
+            assinatura.append(tuple(x[0] for x in janelas))
+            valores += [x[1] for x in janelas]
+
+        layout = self._layout(tuple(assinatura))
+
+        return(layout, np.concatenate(valores)[layout["indices"]])
+
+    def _monta_saida(self, jogos, layout, valores):
+        """
+            Monta os DataFrames da linha completa e dos deltas a partir dos vetores de valores dos jogos
+        """
+        index = pd.Index([x["game"] for x in jogos], name="game")
+        info = pd.DataFrame([{k: x[k] for k in ["team_home", "team_away", "data"]} for x in jogos], index=index)
+
+        linha = pd.concat([info, pd.DataFrame(valores, index=index, columns=layout["colunas"])], axis=1)
+
+        deltas = pd.DataFrame(valores[:, layout["delta_a"]] - valores[:, layout["delta_b"]], index=index,
+                              columns=layout["delta_colunas"])
+        deltas = pd.concat([linha[self.keep_features], deltas], axis=1)
+
+        return(linha, deltas)
+
+    def _jogo(self, team_home, team_away, data, game=None):
+        data = pd.Timestamp(data)
+        if game is None:
+            game = team_home + " X " + team_away + " " + data.strftime("%Y-%m-%d")
+
+        return({"game": game, "team_home": team_home, "team_away": team_away, "data": data})
+
+    def features(self, team_home, team_away, data):
+        """
+            Retorna as variáveis de um jogo: a linha completa dos últimos N jogos e a linha de deltas (D1, D2, C1 e C2)
+
+            Parâmetros:
+                team_home: Time mandante
+                team_away: Time visitante
+                     data: Data do jogo
+        """
+        jogo = self._jogo(team_home, team_away, data)
+        layout, valores = self._vetor(team_home, team_away, jogo["data"])
+
+        return(self._monta_saida([jogo], layout, valores[None, :]))
+
+    def features_rodada(self, fixtures):
+        """
+            Retorna as variáveis de todos os jogos de uma rodada, no mesmo formato do método 'features()'
+
+            Parâmetros:
+                fixtures: DataFrame com as colunas 'team_home', 'team_away' e 'data' (ex.: retorno de 'fixtures_pendentes()').
+                          Se possuir a coluna 'game', ela é usada como índice
+        """
+        jogos = []
+        grupos = {}
+        for x in fixtures.itertuples(index=False):
+            jogo = self._jogo(x.team_home, x.team_away, x.data, game=getattr(x, "game", None))
+            layout, valores = self._vetor(jogo["team_home"], jogo["team_away"], jogo["data"])
+
+            jogos.append(jogo)
+            grupos.setdefault(id(layout), (layout, []))[1].append((len(jogos) - 1, valores))
+
+        # Normalmente todos os jogos têm o mesmo layout
+        linhas = []
+        deltas = []
+        for layout, itens in grupos.values():
+            linha, delta = self._monta_saida([jogos[i] for i, _ in itens], layout, np.vstack([v for _, v in itens]))
+            linhas.append(linha)
+            deltas.append(delta)
+
+        return(pd.concat(linhas, sort=False), pd.concat(deltas, sort=False))
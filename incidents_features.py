@@ -0,0 +1,227 @@
+import pandas as pd
+import numpy as np
+import glob
+import os
+
+INCIDENT_TYPES = ['goal', 'card', 'substitution', 'period', 'injuryTime']
+
+def le_incidents(prefix, temporadas = None, root = ".", types = INCIDENT_TYPES):
+    """
+        Lê as tabelas de incidents de uma liga, juntando todas as temporadas em um DataFrame por tipo de incident
+
+        Parâmetros:
+                prefix: Prefixo da liga (ex.: 'EPL', 'BR', '2nd_GER')
+            temporadas: Lista de temporadas (ex.: ['EPL_18_19']). Se None, lê todas as temporadas da liga
+                  root: Diretório raiz do repositório
+                 types: Tipos de incident a ler
+    """
+    resp = {}
+    for key in types:
+        arquivos = sorted(glob.glob(os.path.join(root, prefix + "_data_sofa_score", "*", "incidents_" + key + "_data_*.csv")))
+        if temporadas is not None:
+            arquivos = [x for x in arquivos if os.path.basename(os.path.dirname(x)) in temporadas]
+
+        if(len(arquivos) == 0):
+            resp[key] = pd.DataFrame(columns=["game", "time", "addedTime"])
+            continue
+
+        temp = pd.concat([pd.read_csv(x, sep=";") for x in arquivos], ignore_index=True, sort=False)
+        if "id" in temp.columns:
+            temp = temp.drop_duplicates(["game", "id"])
+        else:
+            temp = temp.drop_duplicates()
+        resp[key] = temp
+
+    return(resp)
+
+def _prepara_eventos(df):
+    """
+        Cria as colunas 'minuto' (minuto do jogo limitado entre 0 e 90), 'ordem' (ordem cronológica considerando os
+        acréscimos) e 'fl_home' (1 para o time da casa)
+    """
+    df = df.copy()
+    added = pd.to_numeric(df["addedTime"], errors="coerce").fillna(0) if "addedTime" in df.columns else 0
+    df["minuto"] = pd.to_numeric(df["time"], errors="coerce").fillna(0).clip(0, 90)
+    df["ordem"] = df["minuto"] + added / 100
+    if "isHome" in df.columns:
+        df["fl_home"] = df["isHome"].astype(str).str.lower().eq("true").astype(int)
+    return(df.sort_values(["game", "ordem"], kind="mergesort"))
+
+def _minutos_por_estado(eventos, fim = 90):
+    """
+        A partir de eventos com a coluna 'delta' (+1 a favor do mandante, -1 a favor do visitante), retorna por jogo
+        o número de minutos em que o saldo acumulado foi positivo ('_home') e negativo ('_away')
+    """
+    if(len(eventos) == 0):
+        return(pd.DataFrame(columns=["_home", "_away"], dtype=float))
+
+    grupos = eventos.groupby("game", sort=False)
+    estado = grupos["delta"].cumsum()
+    proximo = grupos["minuto"].shift(-1).fillna(fim)
+    duracao = (proximo - eventos["minuto"]).clip(lower=0)
+
+    return(pd.DataFrame({
+        "_home": duracao.where(estado > 0, 0),
+        "_away": duracao.where(estado < 0, 0),
+        "game": eventos["game"]
+    }).groupby("game").sum())
+
+def _por_lado(df, valores, nome, agg = "sum"):
+    """
+        Agrega 'valores' por jogo e lado, retornando as colunas '<nome>_home' e '<nome>_away'
+    """
+    resp = (pd.DataFrame({"game": df["game"].values, "fl_home": df["fl_home"].values, "v": np.asarray(valores, dtype=float)})
+            .groupby(["game", "fl_home"])["v"].agg(agg).unstack("fl_home"))
+    resp = resp.reindex(columns=[1, 0])
+    resp.columns = [nome + "_home", nome + "_away"]
+    return(resp)
+
+def features_gols(goals):
+    """
+        Variáveis da linha do tempo dos gols: minuto e lado do primeiro gol, gols por faixa de minutos, gols de pênalti
+        e minutos em vantagem no placar
+    """
+    goals = _prepara_eventos(goals)
+    primeiro = goals.groupby("game", sort=False).head(1).set_index("game")
+
+    resp = pd.DataFrame(index=pd.Index(goals["game"].unique(), name="game"))
+    resp["fl_first_goal_home"] = primeiro["fl_home"]
+    resp["fl_first_goal_away"] = 1 - primeiro["fl_home"]
+
+    resp = resp.join(_por_lado(goals, goals["minuto"], "first_goal_minute", agg="min"))
+    resp = resp.join(_por_lado(goals, goals["minuto"] <= 45, "goals_1st_half"))
+    resp = resp.join(_por_lado(goals, goals["minuto"] > 75, "goals_after_75"))
+    resp = resp.join(_por_lado(goals, goals["minuto"] <= 15, "goals_first_15"))
+    resp = resp.join(_por_lado(goals, goals["incidentClass"] == "penalty", "penalty_goals"))
+    resp = resp.join(_por_lado(goals, goals["incidentClass"] == "ownGoal", "own_goals_for"))
+
+    goals["delta"] = np.where(goals["fl_home"] == 1, 1, -1)
+    lideranca = _minutos_por_estado(goals)
+    lideranca.columns = ["minutes_leading_home", "minutes_leading_away"]
+    resp = resp.join(lideranca)
+
+    return(resp)
+
+def features_cartoes(cards):
+    """
+        Variáveis da linha do tempo dos cartões: cartões amarelos e vermelhos, minuto do primeiro vermelho
+        e minutos com vantagem numérica
+    """
+    cards = _prepara_eventos(cards)
+    expulsao = cards["incidentClass"].isin(["red", "yellowRed"])
+
+    resp = pd.DataFrame(index=pd.Index(cards["game"].unique(), name="game"))
+    resp = resp.join(_por_lado(cards, cards["incidentClass"] == "yellow", "yellow_cards"))
+    resp = resp.join(_por_lado(cards, expulsao, "red_cards"))
+    resp = resp.join(_por_lado(cards, (cards["minuto"] > 75) & ~expulsao, "yellow_cards_after_75"))
+
+    vermelhos = cards[expulsao].copy()
+    resp = resp.join(_por_lado(vermelhos, vermelhos["minuto"], "first_red_minute", agg="min"))
+
+    # Expulsão do visitante dá vantagem numérica ao mandante
+    vermelhos["delta"] = np.where(vermelhos["fl_home"] == 1, -1, 1)
+    vantagem = _minutos_por_estado(vermelhos)
+    vantagem.columns = ["minutes_man_advantage_home", "minutes_man_advantage_away"]
+    resp = resp.join(vantagem)
+
+    return(resp)
+
+def features_substituicoes(subs):
+    """
+        Variáveis da linha do tempo das substituições: número de trocas, minuto da primeira troca, minuto médio
+        das trocas, trocas antes dos 60 minutos e trocas por lesão
+    """
+    subs = _prepara_eventos(subs)
+    lesao = subs["injury"].astype(str).str.lower().eq("true") if "injury" in subs.columns else pd.Series(False, index=subs.index)
+
+    resp = pd.DataFrame(index=pd.Index(subs["game"].unique(), name="game"))
+    resp = resp.join(_por_lado(subs, np.ones(len(subs)), "n_subs"))
+    resp = resp.join(_por_lado(subs, subs["minuto"], "first_sub_minute", agg="min"))
+    resp = resp.join(_por_lado(subs, subs["minuto"], "avg_sub_minute", agg="mean"))
+    resp = resp.join(_por_lado(subs, subs["minuto"] < 60, "subs_before_60"))
+    resp = resp.join(_por_lado(subs, lesao, "injury_subs"))
+
+    return(resp)
+
+def features_periodos(periods, injury_time = None):
+    """
+        Variáveis dos períodos: placar no intervalo e acréscimos de cada tempo.
+        Os acréscimos ficam NaN nos jogos sem a tabela 'injuryTime' (a informação não existe, não é acréscimo zero).
+    """
+    ht = periods[periods["text"] == "HT"].drop_duplicates("game").set_index("game")
+
+    resp = pd.DataFrame(index=pd.Index(periods["game"].unique(), name="game"))
+    resp["ht_score_home"] = pd.to_numeric(ht["homeScore"], errors="coerce")
+    resp["ht_score_away"] = pd.to_numeric(ht["awayScore"], errors="coerce")
+
+    if injury_time is not None and len(injury_time) > 0:
+        acrescimos = (injury_time.drop_duplicates(["game", "time"])
+                      .pivot(index="game", columns="time", values="length")
+                      .reindex(columns=[45, 90]))
+        acrescimos.columns = ["injury_time_1st", "injury_time_2nd"]
+        resp = resp.join(acrescimos, how="outer")
+
+    return(resp)
+
+def gera_features_incidents(incidents):
+    """
+        Calcula as variáveis da linha do tempo de cada jogo a partir das tabelas de incidents (retorno de 'le_incidents()').
+        Todo o cálculo é feito com operações agrupadas por jogo, sem loops por jogo.
+
+        Os jogos sem um determinado incident recebem 0 nas contagens e nos minutos, e 90 nos minutos de eventos ('first_*' e 'avg_*').
+        Os acréscimos ('injury_time_*') não são preenchidos.
+
+        Parâmetros:
+            incidents: Dicionário com os DataFrames de incidents por tipo ('goal', 'card', 'substitution', 'period', 'injuryTime')
+    """
+    partes = []
+    if len(incidents.get("goal", [])) > 0:
+        partes.append(features_gols(incidents["goal"]))
+    if len(incidents.get("card", [])) > 0:
+        partes.append(features_cartoes(incidents["card"]))
+    if len(incidents.get("substitution", [])) > 0:
+        partes.append(features_substituicoes(incidents["substitution"]))
+    if len(incidents.get("period", [])) > 0:
+        partes.append(features_periodos(incidents["period"], incidents.get("injuryTime")))
+
+    if(len(partes) == 0):
+        return(pd.DataFrame(index=pd.Index([], name="game")))
+
+    resp = pd.concat(partes, axis=1, sort=False)
+    resp.index.name = "game"
+
+    # A tabela de períodos não existe para todos os jogos; nesses casos o placar do intervalo vem dos gols
+    if "ht_score_home" in resp.columns and "goals_1st_half_home" in resp.columns:
+        resp["ht_score_home"] = resp["ht_score_home"].fillna(resp["goals_1st_half_home"])
+        resp["ht_score_away"] = resp["ht_score_away"].fillna(resp["goals_1st_half_away"])
+
+    return(_preenche_vazios(resp, resp.columns))
+
+def _preenche_vazios(resp, columns):
+    """
+        Preenche os jogos sem incidents: 90 nos minutos de eventos ('first_*' e 'avg_*') e 0 nas demais variáveis,
+        exceto os acréscimos ('injury_time_*'), que ficam NaN quando desconhecidos
+    """
+    minutos = [x for x in columns if x.startswith("first_") or x.startswith("avg_")]
+    outras = [x for x in columns if x not in minutos and not x.startswith("injury_time_")]
+
+    resp[minutos] = resp[minutos].fillna(90)
+    resp[outras] = resp[outras].fillna(0)
+
+    return(resp)
+
+def junta_features_incidents(games, incidents):
+    """
+        Junta as variáveis da linha do tempo dos incidents na base de jogos pela coluna 'game', para que sejam
+        agregadas pelo método 'gera_last_N_games()' como as demais estatísticas '_home'/'_away'
+
+        Parâmetros:
+                games: DataFrame com a coluna 'game' (ex.: retorno de 'prepara_base_sofa_score()')
+            incidents: Dicionário de incidents (retorno de 'le_incidents()')
+    """
+    features = gera_features_incidents(incidents)
+    features = features.drop([x for x in features.columns if x in games.columns], axis=1)
+
+    resp = games.merge(features, how="left", left_on="game", right_index=True)
+
+    return(_preenche_vazios(resp, features.columns))
@@ -0,0 +1,271 @@
+import pandas as pd
+import hashlib
+import json
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+from functools import partial
+
+from data_prep_functions import prepara_base_sofa_score, gera_last_N_games, variaveis_delta
+
+def hash_arquivo(path, block_size=1 << 20):
+    """
+        Retorna o hash sha256 do conteúdo de um arquivo (ou None se o arquivo não existir)
+    """
+    if not os.path.exists(path):
+        return(None)
+
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for bloco in iter(lambda: f.read(block_size), b""):
+            h.update(bloco)
+    return(h.hexdigest())
+
+def _nome_func(func):
+    """
+        Identificador estável de uma função (inclusive 'functools.partial'), usado na composição do hash dos estágios
+    """
+    if isinstance(func, partial):
+        return(_nome_func(func.func) + "(" + ",".join(k + "=" + _nome_func(v) for k, v in sorted(func.keywords.items()) if callable(v)) + ")")
+    return(getattr(func, "__module__", "") + "." + getattr(func, "__qualname__", repr(func)))
+
+class Estagio:
+    """
+        Estágio do pipeline. Executa 'func(inputs, outputs, **params)' e deve gravar todos os arquivos de 'outputs'.
+
+        Parâmetros:
+              name: Nome único do estágio
+              func: Função executada pelo estágio
+            inputs: Lista de arquivos lidos pelo estágio
+           outputs: Lista de arquivos gravados pelo estágio
+            params: Dicionário de parâmetros da função (precisa ser serializável em JSON)
+    """
+
+    def __init__(self, name, func, inputs, outputs, params = {}):
+        self.name = name
+        self.func = func
+        self.inputs = list(inputs)
+        self.outputs = list(outputs)
+        self.params = dict(params)
+
+    def hash(self):
+        """
+            Hash do conteúdo dos arquivos de entrada, dos parâmetros e da função do estágio
+        """
+        conteudo = {
+            "func": _nome_func(self.func),
+            "params": self.params,
+            "inputs": {path: hash_arquivo(path) for path in self.inputs}
+        }
+        return(hashlib.sha256(json.dumps(conteudo, sort_keys=True, default=str).encode()).hexdigest())
+
+def _roda_estagio(func, inputs, outputs, params):
+    """
+        Executa a função de um estágio em um processo do pool, retornando (status, tempo, erro)
+    """
+    inicio = time.time()
+    try:
+        for path in outputs:
+            if os.path.dirname(path):
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+
+        func(inputs, outputs, **params)
+    except Exception as e:
+        return("erro", time.time() - inicio, repr(e))
+
+    return("executado", time.time() - inicio, None)
+
+class Pipeline:
+    """
+        Executa um conjunto de estágios respeitando as dependências entre eles, que são inferidas pelos arquivos:
+        um estágio depende de outro quando lê algum arquivo que o outro grava.
+
+        O hash de cada estágio executado é guardado em 'state_path'. Na próxima execução, um estágio só é
+        executado novamente se o conteúdo das suas entradas, os seus parâmetros ou a sua função mudarem, ou se alguma
+        saída não existir. Estágios independentes são executados em paralelo, em processos separados (o trabalho dos
+        estágios é em grande parte Python/pandas e não rodaria em paralelo em threads). Por isso as funções dos estágios
+        precisam ser serializáveis: funções de módulo ou 'functools.partial' delas. O arquivo de estado é gravado apenas
+        pelo processo principal.
+
+        Parâmetros:
+             state_path: Arquivo JSON com os hashes da última execução de cada estágio
+            max_workers: Número máximo de estágios executados ao mesmo tempo
+    """
+
+    def __init__(self, state_path = ".pipeline_state.json", max_workers = 4):
+        self.state_path = state_path
+        self.max_workers = max_workers
+        self.estagios = {}
+
+    def adiciona(self, estagios):
+        """
+            Adiciona um estágio ou uma lista de estágios ao pipeline
+        """
+        if isinstance(estagios, Estagio):
+            estagios = [estagios]
+
+        for estagio in estagios:
+            if estagio.name in self.estagios:
+                raise ValueError("Estágio duplicado: " + estagio.name)
+            self.estagios[estagio.name] = estagio
+
+        return(self)
+
+    def dependencias(self):
+        """
+            Retorna um dicionário com os estágios dos quais cada estágio depende
+        """
+        produtor = {}
+        for estagio in self.estagios.values():
+            for path in estagio.outputs:
+                produtor[path] = estagio.name
+
+        return({estagio.name: set(produtor[path] for path in estagio.inputs if path in produtor) - {estagio.name}
+                for estagio in self.estagios.values()})
+
+    def _le_estado(self):
+        if not os.path.exists(self.state_path):
+            return({})
+        with open(self.state_path, "r") as f:
+            return(json.load(f))
+
+    def _grava_estado(self, estado):
+        tmp_path = self.state_path + ".tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(estado, f, indent=2, sort_keys=True)
+        os.replace(tmp_path, self.state_path)
+
+    def executa(self, forca = False, verbose = True):
+        """
+            Executa o pipeline e retorna um DataFrame com o status e o tempo (em segundos) de cada estágio.
+            Os estágios posteriores a um estágio com erro não são executados.
+
+            Parâmetros:
+                 forca: (Boolean) Executa todos os estágios, ignorando os hashes guardados
+               verbose: (Boolean) Imprime o status de cada estágio ao terminar
+        """
+        dependencias = self.dependencias()
+        estado = self._le_estado()
+
+        status = {}
+        relatorio = []
+        pendentes = dict(dependencias)
+        rodando = {}
+        hashes = {}
+
+        with ProcessPoolExecutor(max_workers=self.max_workers) as executor:
+            while pendentes or rodando:
+                # Estágios cujas dependências falharam não são executados
+                for name in list(pendentes):
+                    if any(status.get(dep) in ("erro", "não executado") for dep in pendentes[name]):
+                        status[name] = "não executado"
+                        relatorio.append({"estagio": name, "status": "não executado", "tempo_s": 0.0, "erro": None})
+                        del pendentes[name]
+
+                prontos = [name for name in pendentes if all(dep in status for dep in pendentes[name])]
+                for name in prontos:
+                    del pendentes[name]
+                    estagio = self.estagios[name]
+                    hashes[name] = estagio.hash()
+
+                    if(not forca and estado.get(name) == hashes[name] and all(os.path.exists(x) for x in estagio.outputs)):
+                        status[name] = "pulado"
+                        relatorio.append({"estagio": name, "status": "pulado", "tempo_s": 0.0, "erro": None})
+                        if verbose:
+                            print("%-40s %-14s %8.2fs" % (name, "pulado", 0.0))
+                        continue
+
+                    rodando[executor.submit(_roda_estagio, estagio.func, estagio.inputs, estagio.outputs, estagio.params)] = name
+
+                # Estágios pulados podem liberar outros estágios
+                if not rodando and any(all(dep in status for dep in pendentes[name]) for name in pendentes):
+                    continue
+
+                if not rodando:
+                    if pendentes:
+                        raise ValueError("Dependência circular entre os estágios: " + ", ".join(pendentes))
+                    break
+
+                finalizados, _ = wait(list(rodando), return_when=FIRST_COMPLETED)
+                for futuro in finalizados:
+                    name = rodando.pop(futuro)
+                    try:
+                        resultado, tempo, erro = futuro.result()
+                    except Exception as e:
+                        # Ex.: função do estágio que não pode ser enviada a outro processo
+                        resultado, tempo, erro = "erro", 0.0, repr(e)
+
+                    if(resultado == "executado"):
+                        estado[name] = hashes[name]
+                        self._grava_estado(estado)
+
+                    status[name] = resultado
+                    relatorio.append({"estagio": name, "status": resultado, "tempo_s": tempo, "erro": erro})
+
+                    if verbose:
+                        print("%-40s %-14s %8.2fs" % (name, resultado, tempo) + ("  " + erro if erro else ""))
+
+        return(pd.DataFrame(relatorio, columns=["estagio", "status", "tempo_s", "erro"]).set_index("estagio"))
+
+# ---------------------------------
+# Estágios padrão por liga/temporada
+# ---------------------------------
+def _estagio_scrape(inputs, outputs, scrape_func):
+    scrape_func(inputs[0], os.path.dirname(outputs[0]))
+
+def _estagio_base(inputs, outputs, period="ALL"):
+    base = pd.read_csv(inputs[0], sep=";")
+    prepara_base_sofa_score(base, period=period).to_csv(outputs[0], sep=";", index=False)
+
+def _estagio_per_game(inputs, outputs, N=[5], to_drop=[], D=None):
+    base = pd.read_csv(inputs[0], sep=";", parse_dates=["data"])
+    gera_last_N_games(base, all_games=base, N=N, to_drop=list(to_drop), D=D).to_csv(outputs[0], sep=";")
+
+def _estagio_delta_cross(inputs, outputs, N=[5], keep_features=[], to_predict=False, D=None):
+    base_final = pd.read_csv(inputs[0], sep=";", index_col=0)
+    variaveis_delta(base_final, N=N, to_predict=to_predict, keep_features=list(keep_features),
+                    D=D or []).to_csv(outputs[0], sep=";")
+
+def estagios_liga_temporada(prefix, temporada, N = [5], period = "ALL", D = None,
+                            to_drop = ['fl_home_win', 'game', 'hora', 'result', 'data', 'index',
+                                       'fl_away_win', 'fl_draw', 'fl_win_home'],
+                            keep_features = ['team_home', 'team_away', 'home_score', 'away_score', 'data', 'hora', 'result',
+                                             'fl_home_win', 'fl_away_win', 'fl_draw'],
+                            scrape_func = None, root = "."):
+    """
+        Declara os estágios do fluxo de uma liga/temporada:
+            links_sofa_score -> game_data_*.csv -> Processadas/*_base.csv -> Processadas/*_per_game.csv -> Processadas/*_delta_cross.csv
+
+        Parâmetros:
+                 prefix: Prefixo da liga (ex.: 'EPL', 'BR', '2nd_GER')
+              temporada: Temporada no formato dos arquivos (ex.: '17_18', '2019')
+                      N: Lista com os tamanhos de janelas dos últimos jogos
+                 period: Período das estatísticas usado na base ('ALL', '1ST' ou '2ND')
+                      D: Lista com os tamanhos das janelas em dias (ver 'gera_last_D_days()'). Se None, não gera
+                to_drop: (List) Colunas a desconsiderar em 'gera_last_N_games()'
+          keep_features: Lista de features mantidas em 'variaveis_delta()'
+            scrape_func: Função 'scrape_func(links_path, output_dir)' que grava o 'game_data_*.csv' a partir dos links.
+                         Se None, o 'game_data_*.csv' é tratado como entrada do pipeline
+                   root: Diretório raiz do repositório
+    """
+    name = prefix + "_" + temporada
+    pasta = os.path.join(root, prefix + "_data_sofa_score")
+
+    links = os.path.join(root, "links_sofa_score", "sofa_score_links_" + name + ".csv")
+    game_data = os.path.join(pasta, name, "game_data_" + name + ".csv")
+    base = os.path.join(pasta, "Processadas", name + "_base.csv")
+    per_game = os.path.join(pasta, "Processadas", name + "_per_game.csv")
+    delta_cross = os.path.join(pasta, "Processadas", name + "_delta_cross.csv")
+
+    estagios = []
+    if scrape_func is not None:
+        estagios.append(Estagio(name + ":scrape", partial(_estagio_scrape, scrape_func=scrape_func), [links], [game_data]))
+
+    estagios += [
+        Estagio(name + ":base", _estagio_base, [game_data], [base], {"period": period}),
+        Estagio(name + ":per_game", _estagio_per_game, [base], [per_game], {"N": N, "to_drop": to_drop, "D": D}),
+        Estagio(name + ":delta_cross", _estagio_delta_cross, [per_game], [delta_cross],
+                {"N": N, "keep_features": keep_features, "to_predict": False, "D": D})
+    ]
+
+    return(estagios)
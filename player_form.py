@@ -0,0 +1,233 @@
+import pandas as pd
+import numpy as np
+import glob
+import os
+
+PLAYER_STATS = ["rating", "minutesPlayed", "goals", "goalAssist", "keyPass", "shotsOnTarget", "accuratePass",
+                "totalPass", "touches", "totalTackle", "interceptionWon", "groundDuels", "aerialDuels", "possessionLost"]
+
+def le_players_data(root = ".", prefixes = None, com_substituicoes = True):
+    """
+        Lê os arquivos 'players_data_*.csv' (e, opcionalmente, as substituições) de todas as ligas e temporadas
+
+        Parâmetros:
+                         root: Diretório raiz do repositório
+                     prefixes: Lista de prefixos das ligas (ex.: ['EPL', 'BR']). Se None, lê todas as pastas '*_data_sofa_score'
+            com_substituicoes: (Boolean) Também lê os arquivos 'incidents_substitution_data_*.csv'
+    """
+    def le(pattern):
+        resp = []
+        for path in sorted(glob.glob(os.path.join(root, "*_data_sofa_score", "*", pattern))):
+            liga = os.path.basename(os.path.dirname(os.path.dirname(path))).replace("_data_sofa_score", "")
+            if prefixes is None or liga in prefixes:
+                resp.append(pd.read_csv(path, sep=";"))
+        return(pd.concat(resp, ignore_index=True, sort=False) if len(resp) > 0 else None)
+
+    players = le("players_data_*.csv")
+    substituicoes = le("incidents_substitution_data_*.csv") if com_substituicoes else None
+
+    return(players, substituicoes)
+
+def _primeiro_numero(serie):
+    """
+        Extrai o primeiro número de textos como "57 (85%)", "4 (1)" ou "90'"
+    """
+    if pd.api.types.is_numeric_dtype(serie):
+        return(serie.astype(float))
+
+    # Os textos se repetem muito: converte apenas os valores únicos
+    codigos, unicos = pd.factorize(serie.astype(str))
+    numeros = pd.to_numeric(pd.Series(unicos).str.extract(r"^\s*(-?\d+(?:\.\d+)?)")[0], errors="coerce").values
+    return(pd.Series(np.where(codigos >= 0, numeros[codigos], np.nan), index=serie.index))
+
+def prepara_players(players, substituicoes = None, stats = PLAYER_STATS):
+    """
+        Converte as estatísticas dos jogadores em números, codifica jogadores, times e jogos como inteiros e marca os titulares.
+
+        Os titulares são os jogadores que não entraram em uma substituição ('playerIn' do arquivo de substituições).
+        Sem o arquivo de substituições, são considerados titulares os 11 jogadores com mais minutos de cada time no jogo.
+
+        Parâmetros:
+                  players: DataFrame com os dados de 'players_data_*.csv'
+            substituicoes: DataFrame com os dados de 'incidents_substitution_data_*.csv' (opcional)
+                    stats: Lista das estatísticas a manter
+    """
+    stats = [x for x in stats if x in players.columns]
+
+    resp = pd.DataFrame({
+        "game": players["game"].values,
+        "player_id": players["id"].values.astype(np.int64),
+        "team": players["team"].astype(str).values,
+        "team_id": players["team_id"].values.astype(np.int64)
+    })
+
+    # O mandante é o primeiro time do nome do jogo ('SWA X NEW 2013-03-02')
+    resp["fl_home"] = (resp["team"] == resp["game"].astype(str).str.split(" X ").str[0]).astype(int).values
+
+    datas = players["game"].astype(str).str[-10:]
+    resp["data"] = pd.to_datetime(datas, format="%Y-%m-%d", errors="coerce").fillna(
+        pd.to_datetime(datas, format="%d-%m-%Y", errors="coerce")).values
+
+    for stat in stats:
+        valores = _primeiro_numero(players[stat])
+        resp[stat] = valores.values if stat == "rating" else valores.fillna(0).values
+
+    resp = resp.drop_duplicates(["game", "player_id"]).reset_index(drop=True)
+
+    # Os times são codificados pelo 'team_id': a sigla se repete entre ligas (ex.: MUN, INT, PAL, SAN)
+    resp["team_code"] = pd.factorize(resp["team_id"])[0]
+    jogos = pd.Index(pd.unique(resp["game"]))
+    resp["game_code"] = jogos.get_indexer(resp["game"])
+
+    # Titulares
+    if substituicoes is not None and len(substituicoes) > 0:
+        entrou = pd.to_numeric(substituicoes["playerIn"].astype(str).str.extract(r"'id':\s*(\d+)")[0], errors="coerce").values
+        game_entrou = jogos.get_indexer(substituicoes["game"])
+        validos = ~np.isnan(entrou) & (game_entrou >= 0)
+
+        n_players = max(resp["player_id"].max(), np.nanmax(entrou, initial=0)) + 1
+        chave_entrou = game_entrou[validos].astype(np.int64) * n_players + entrou[validos].astype(np.int64)
+        chave = resp["game_code"].values.astype(np.int64) * n_players + resp["player_id"].values
+        resp["fl_starter"] = (~np.isin(chave, chave_entrou)).astype(int)
+    else:
+        posicao = (resp.sort_values("minutesPlayed", ascending=False, kind="mergesort")
+                   .groupby(["game_code", "team_code"]).cumcount())
+        resp["fl_starter"] = (posicao.reindex(resp.index) < 11).astype(int)
+
+    return(resp)
+
+def _rolling_por_grupo(grupo, valores, k):
+    """
+        Soma e contagem (ignorando NaN) dos últimos k valores de cada linha dentro do seu grupo, incluindo a própria linha.
+        'grupo' e 'valores' devem estar ordenados por grupo e data.
+    """
+    n = len(grupo)
+    inicio_grupo = np.r_[0, np.flatnonzero(grupo[1:] != grupo[:-1]) + 1]
+    inicio = np.repeat(inicio_grupo, np.diff(np.r_[inicio_grupo, n]))
+    inicio = np.maximum(inicio, np.arange(n) - k + 1)
+
+    validos = ~np.isnan(valores)
+    acc = np.vstack([np.zeros((1, valores.shape[1])), np.cumsum(np.where(validos, valores, 0), axis=0)])
+    acc_n = np.vstack([np.zeros((1, valores.shape[1])), np.cumsum(validos, axis=0)])
+
+    fim = np.arange(1, n + 1)
+    return(acc[fim] - acc[inicio], acc_n[fim] - acc_n[inicio])
+
+def gera_forma_jogadores(players, k = 5, stats = PLAYER_STATS):
+    """
+        Calcula a forma de cada jogador: a média das estatísticas nas suas últimas k aparições, incluindo o próprio jogo.
+        O cálculo é feito de uma vez para todos os jogadores, com os arrays ordenados por jogador e data.
+
+        Parâmetros:
+            players: DataFrame retornado por 'prepara_players()'
+                  k: Número de aparições da janela
+              stats: Lista das estatísticas
+    """
+    stats = [x for x in stats if x in players.columns]
+    ordem = np.lexsort((players["data"].values, players["player_id"].values))
+    ordenados = players.iloc[ordem].reset_index(drop=True)
+
+    soma, n = _rolling_por_grupo(ordenados["player_id"].values, ordenados[stats].to_numpy(dtype=float), k)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        media = soma / n
+
+    for i, stat in enumerate(stats):
+        ordenados["FORM_" + stat] = media[:, i]
+    ordenados["FORM_n_games"] = np.minimum(ordenados.groupby("player_id").cumcount().values + 1, k)
+
+    return(ordenados)
+
+def gera_forma_times(forma, stats = PLAYER_STATS):
+    """
+        Agrega a forma dos jogadores por time e transforma em variáveis pré-jogo: cada jogo do time recebe a forma dos
+        jogadores ao fim do jogo anterior do mesmo time.
+            STARTERS_FORM_<stat>: forma média dos titulares do jogo anterior
+            MINUTES_W_FORM_<stat>: forma dos jogadores do jogo anterior ponderada pelos minutos jogados
+
+        Parâmetros:
+            forma: DataFrame retornado por 'gera_forma_jogadores()'
+            stats: Lista das estatísticas
+    """
+    colunas = ["FORM_" + x for x in stats if "FORM_" + x in forma.columns]
+    valores = forma[colunas].to_numpy(dtype=float)
+    minutos = forma["minutesPlayed"].to_numpy(dtype=float)[:, None] if "minutesPlayed" in forma.columns else np.ones((len(forma), 1))
+    starter = forma["fl_starter"].to_numpy(dtype=float)[:, None]
+
+    validos = ~np.isnan(valores)
+    zerados = np.where(validos, valores, 0)
+
+    # Somas por (time, jogo) com códigos inteiros
+    chave, chaves = pd.factorize(forma["team_code"].values.astype(np.int64) * (forma["game_code"].max() + 1)
+                                 + forma["game_code"].values.astype(np.int64))
+    n_chaves = len(chaves)
+
+    def soma_por_chave(x):
+        resp = np.zeros((n_chaves, x.shape[1]))
+        np.add.at(resp, chave, x)
+        return(resp)
+
+    with np.errstate(invalid="ignore", divide="ignore"):
+        starters = soma_por_chave(zerados * starter) / soma_por_chave(validos * starter)
+        ponderada = soma_por_chave(zerados * minutos) / soma_por_chave(validos * minutos)
+
+    primeira = pd.Series(np.arange(len(forma))).groupby(chave).first().values
+    times = pd.DataFrame({
+        "game": forma["game"].values[primeira],
+        "team": forma["team"].values[primeira],
+        "team_id": forma["team_id"].values[primeira],
+        "team_code": forma["team_code"].values[primeira],
+        "fl_home": forma["fl_home"].values[primeira],
+        "data": forma["data"].values[primeira]
+    })
+
+    for i, coluna in enumerate(colunas):
+        times["STARTERS_" + coluna] = starters[:, i]
+        times["MINUTES_W_" + coluna] = ponderada[:, i]
+
+    # Desloca para o próximo jogo do time: a forma ao fim do jogo anterior é a variável pré-jogo
+    times = times.sort_values(["team_code", "data"], kind="mergesort").reset_index(drop=True)
+    features = [x for x in times.columns if x.startswith("STARTERS_") or x.startswith("MINUTES_W_")]
+    times[features] = times.groupby("team_code")[features].shift(1)
+
+    return(times)
+
+def junta_forma_jogadores(games, forma_times):
+    """
+        Junta as variáveis de forma dos jogadores na base de jogos pela coluna 'game', nas visões '_home' e '_away'.
+        Cada linha de 'forma_times' é encontrada pela chave inteira (jogo, mandante/visitante), sem depender da sigla do time.
+
+        Parâmetros:
+                  games: DataFrame com a coluna 'game'
+            forma_times: DataFrame retornado por 'gera_forma_times()'
+    """
+    features = [x for x in forma_times.columns if x.startswith("STARTERS_") or x.startswith("MINUTES_W_")]
+
+    jogos = pd.Index(pd.unique(forma_times["game"]))
+    chaves = pd.Index(jogos.get_indexer(forma_times["game"]) * 2 + forma_times["fl_home"].values)
+    valores = forma_times[features].to_numpy(dtype=float)
+
+    game_code = jogos.get_indexer(games["game"])
+
+    resp = games.copy()
+    for side, fl_home in [("home", 1), ("away", 0)]:
+        pos = np.where(game_code >= 0, chaves.get_indexer(game_code * 2 + fl_home), -1)
+        lado = np.where((pos >= 0)[:, None], valores[pos], np.nan)
+        for i, coluna in enumerate(features):
+            resp[coluna + "_" + side] = lado[:, i]
+
+    return(resp)
+
+def gera_features_jogadores(games, players, substituicoes = None, k = 5, stats = PLAYER_STATS):
+    """
+        Executa todo o fluxo de forma dos jogadores e junta as variáveis pré-jogo na base de jogos
+
+        Parâmetros:
+                    games: DataFrame com a coluna 'game'
+                  players: DataFrame com os dados de 'players_data_*.csv'
+            substituicoes: DataFrame com os dados de 'incidents_substitution_data_*.csv' (opcional)
+                        k: Número de aparições da janela de forma dos jogadores
+                    stats: Lista das estatísticas
+    """
+    forma = gera_forma_jogadores(prepara_players(players, substituicoes, stats=stats), k=k, stats=stats)
+
+    return(junta_forma_jogadores(games, gera_forma_times(forma, stats=stats)))
@@ -0,0 +1,191 @@
+import pandas as pd
+import numpy as np
+import glob
+import os
+
+def le_game_data_ligas(root = ".", prefixes = None,
+                       columns = ["game", "data", "team_home", "team_away", "home_score", "away_score", "result"]):
+    """
+        Lê os arquivos 'game_data_*.csv' de todas as ligas e temporadas, mantendo apenas as colunas necessárias para os ratings.
+        Linhas sem data ou sem os times (jogos que não foram raspados) são descartadas.
+
+        Parâmetros:
+                root: Diretório raiz do repositório
+            prefixes: Lista de prefixos das ligas (ex.: ['EPL', 'BR']). Se None, lê todas as pastas '*_data_sofa_score'
+             columns: Colunas lidas de cada arquivo
+    """
+    resp = []
+    for path in sorted(glob.glob(os.path.join(root, "*_data_sofa_score", "*", "game_data_*.csv"))):
+        liga = os.path.basename(os.path.dirname(os.path.dirname(path))).replace("_data_sofa_score", "")
+        if prefixes is not None and liga not in prefixes:
+            continue
+
+        temp = pd.read_csv(path, sep=";", usecols=lambda x: x in columns)
+        temp["liga"] = liga
+        temp["temporada"] = os.path.basename(os.path.dirname(path))
+        resp.append(temp)
+
+    resp = pd.concat(resp, ignore_index=True, sort=False)
+    resp = resp.dropna(subset=["data", "team_home", "team_away"]).reset_index(drop=True)
+    resp["data"] = pd.to_datetime(resp["data"], format="%Y-%m-%d")
+
+    return(resp)
+
+def prepara_arrays_rating(games, league_col = "liga"):
+    """
+        Ordena os jogos por data uma única vez e codifica os times como inteiros. Jogos sem data ou sem os times são descartados.
+        O resultado pode ser reaproveitado em várias chamadas de '_calcula_elo()' (ex.: em 'sweep_ratings()').
+
+        Parâmetros:
+                 games: DataFrame com as colunas 'data', 'team_home', 'team_away', 'home_score', 'away_score' e 'result'
+            league_col: Coluna com a liga. Por padrão 'liga' (criada por 'le_game_data_ligas()'), pois o 'game_data_*.csv'
+                        identifica os times apenas pela sigla, que se repete entre ligas (MUN, INT, PAL, SAN): sem a liga,
+                        clubes diferentes compartilhariam o mesmo rating. Com None, ou se a coluna não existir (base de uma
+                        única liga), os times são identificados apenas pela sigla
+    """
+    validos = np.flatnonzero(games[["data", "team_home", "team_away"]].notna().all(axis=1).values)
+    ordem = validos[np.argsort(games["data"].values[validos], kind="mergesort")]
+    ordenados = games.iloc[ordem]
+
+    team_home = ordenados["team_home"].astype(str)
+    team_away = ordenados["team_away"].astype(str)
+    if league_col is not None and league_col in ordenados.columns:
+        team_home = ordenados[league_col].astype(str) + "|" + team_home
+        team_away = ordenados[league_col].astype(str) + "|" + team_away
+
+    codigos, times = pd.factorize(np.concatenate([team_home.values, team_away.values]))
+
+    return({
+        "ordem": ordem,
+        "home": codigos[:len(ordenados)],
+        "away": codigos[len(ordenados):],
+        "home_score": ordenados["home_score"].values.astype(float),
+        "away_score": ordenados["away_score"].values.astype(float),
+        "result": ordenados["result"].values.astype(float),
+        "times": times
+    })
+
+def _calcula_elo(arrays, k = 20, home_adv = 100, goal_diff = True, init = 1500):
+    """
+        Percorre os jogos em ordem de data uma única vez, atualizando os ratings após cada jogo.
+        Retorna os ratings pré-jogo (geral, como mandante e como visitante) e a expectativa do mandante, na ordem de 'arrays'.
+        Jogos ainda não realizados (placar -1) ou sem placar (NaN) recebem os ratings mas não os atualizam.
+    """
+    n_times = len(arrays["times"])
+    geral = [float(init)] * n_times
+    como_home = [float(init)] * n_times
+    como_away = [float(init)] * n_times
+
+    n = len(arrays["home"])
+    resp_home = np.empty(n)
+    resp_away = np.empty(n)
+    resp_as_home = np.empty(n)
+    resp_as_away = np.empty(n)
+    resp_expected = np.empty(n)
+
+    home = arrays["home"].tolist()
+    away = arrays["away"].tolist()
+    home_score = arrays["home_score"].tolist()
+    away_score = arrays["away_score"].tolist()
+    result = arrays["result"].tolist()
+
+    for i in range(n):
+        h = home[i]
+        a = away[i]
+
+        resp_home[i] = geral[h]
+        resp_away[i] = geral[a]
+        resp_as_home[i] = como_home[h]
+        resp_as_away[i] = como_away[a]
+
+        expected = 1 / (1 + 10 ** ((geral[a] - geral[h] - home_adv) / 400))
+        expected_as = 1 / (1 + 10 ** ((como_away[a] - como_home[h] - home_adv) / 400))
+        resp_expected[i] = expected
+
+        if not (home_score[i] >= 0 and away_score[i] >= 0 and -1 <= result[i] <= 1):
+            continue
+
+        s = (result[i] + 1) / 2
+
+        # Multiplicador pela diferença de gols (World Football Elo)
+        g = 1.0
+        if goal_diff:
+            diff = abs(home_score[i] - away_score[i])
+            if diff == 2:
+                g = 1.5
+            elif diff >= 3:
+                g = (11 + diff) / 8
+
+        delta = k * g * (s - expected)
+        geral[h] += delta
+        geral[a] -= delta
+
+        delta_as = k * g * (s - expected_as)
+        como_home[h] += delta_as
+        como_away[a] -= delta_as
+
+    return(resp_home, resp_away, resp_as_home, resp_as_away, resp_expected)
+
+def gera_ratings(games, k = 20, home_adv = 100, goal_diff = True, init = 1500, league_col = "liga"):
+    """
+        Cria as variáveis de rating (Elo) pré-jogo dos dois times, calculadas em uma única passada em ordem de data.
+        As novas colunas são: 'ELO_home', 'ELO_away', 'ELO_AS_HOME_home', 'ELO_AS_AWAY_away' e 'ELO_EXPECTED_home'.
+
+        Parâmetros:
+                 games: DataFrame com as colunas 'data', 'team_home', 'team_away', 'home_score', 'away_score' e 'result'
+                     k: Fator de atualização dos ratings
+              home_adv: Vantagem do mandante, em pontos de rating
+             goal_diff: (Boolean) Pondera a atualização pela diferença de gols
+                  init: Rating inicial dos times
+            league_col: Coluna com a liga, para manter ratings separados por liga. O padrão 'liga' evita que clubes de
+                        ligas diferentes com a mesma sigla compartilhem rating (ver 'prepara_arrays_rating()')
+    """
+    arrays = prepara_arrays_rating(games, league_col=league_col)
+    resp = _calcula_elo(arrays, k=k, home_adv=home_adv, goal_diff=goal_diff, init=init)
+
+    games = games.copy()
+    for column, valores in zip(["ELO_home", "ELO_away", "ELO_AS_HOME_home", "ELO_AS_AWAY_away", "ELO_EXPECTED_home"], resp):
+        coluna_ordenada = np.full(len(games), np.nan)
+        coluna_ordenada[arrays["ordem"]] = valores
+        games[column] = coluna_ordenada
+
+    return(games)
+
+def sweep_ratings(games, ks = [10, 20, 30, 40], home_advs = [0, 50, 100], goal_diffs = [True, False],
+                  init = 1500, league_col = "liga", burn_in = 0.2):
+    """
+        Avalia combinações de parâmetros do Elo reaproveitando os mesmos arrays ordenados e codificados.
+        Retorna o erro quadrático médio (Brier) e a log loss da expectativa do mandante contra o resultado
+        (vitória = 1, empate = 0.5, derrota = 0), ordenado do melhor para o pior.
+
+        Parâmetros:
+                 games: DataFrame com os jogos (ver 'gera_ratings()')
+                    ks: Lista de valores de k
+             home_advs: Lista de vantagens do mandante
+            goal_diffs: Lista de opções de ponderação pela diferença de gols
+            league_col: Coluna com a liga (ver 'prepara_arrays_rating()'). Por padrão 'liga', para não avaliar os parâmetros
+                        com ratings misturados entre clubes de ligas diferentes com a mesma sigla
+               burn_in: Fração inicial dos jogos desconsiderada na avaliação, enquanto os ratings se estabilizam
+    """
+    arrays = prepara_arrays_rating(games, league_col=league_col)
+
+    jogados = (arrays["home_score"] >= 0) & (arrays["away_score"] >= 0) & (np.abs(arrays["result"]) <= 1)
+    jogados[:int(len(jogados) * burn_in)] = False
+    s = (arrays["result"][jogados] + 1) / 2
+
+    resp = []
+    for k in ks:
+        for home_adv in home_advs:
+            for goal_diff in goal_diffs:
+                expected = _calcula_elo(arrays, k=k, home_adv=home_adv, goal_diff=goal_diff, init=init)[4][jogados]
+                expected = np.clip(expected, 1e-15, 1 - 1e-15)
+
+                resp.append({
+                    "k": k,
+                    "home_adv": home_adv,
+                    "goal_diff": goal_diff,
+                    "brier": np.mean((expected - s) ** 2),
+                    "log_loss": -np.mean(s * np.log(expected) + (1 - s) * np.log(1 - expected))
+                })
+
+    return(pd.DataFrame(resp).sort_values("brier").reset_index(drop=True))
@@ -0,0 +1,225 @@
+import json
+import hashlib
+import os
+from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor
+
+TOURNAMENTS = {
+    "Brasileirao": {"url": "https://www.sofascore.com/pt/torneio/futebol/brazil/brasileiro-serie-a/325",
+                    "ids_file": "IDs_Brasileirao_seasons.json"},
+    "premier_league": {"url": "https://www.sofascore.com/pt/torneio/futebol/england/premier-league/17",
+                       "ids_file": "IDs_premier_league_seasons.json"},
+    "La_Liga": {"url": "https://www.sofascore.com/pt/torneio/futebol/spain/laliga/8",
+                "ids_file": "IDs_La_Liga_seasons.json"},
+    "Bundesliga": {"url": "https://www.sofascore.com/pt/torneio/futebol/germany/bundesliga/35",
+                   "ids_file": "IDs_Bundesliga_seasons.json"},
+    "SerieA_Italiana": {"url": "https://www.sofascore.com/pt/torneio/futebol/italy/serie-a/23",
+                        "ids_file": "IDs_SerieA_Italiana_seasons.json"},
+    "2nd_Bundesliga": {"url": "https://www.sofascore.com/pt/torneio/futebol/germany/2-bundesliga/44",
+                       "ids_file": "IDs_2nd_Bundesliga_seasons.json"}
+}
+
+NEXT_DATA_MARKER = 'id="__NEXT_DATA__"'
+
+def extrai_next_data(chunks):
+    """
+        Extrai o JSON do script '__NEXT_DATA__' de uma página lida em pedaços, sem montar o DOM da página.
+        A leitura é interrompida assim que o script termina, então o restante da página não é lido.
+
+        Parâmetros:
+            chunks: Iterável de pedaços (str) do HTML, ex.: 'response.iter_content(decode_unicode=True)'
+    """
+    buffer = ""
+    dentro = False
+
+    for chunk in chunks:
+        buffer += chunk
+
+        if not dentro:
+            pos = buffer.find(NEXT_DATA_MARKER)
+            if pos < 0:
+                # Mantém apenas o final, caso o marcador esteja dividido entre dois pedaços
+                buffer = buffer[-len(NEXT_DATA_MARKER):]
+                continue
+
+            fim_tag = buffer.find(">", pos)
+            if fim_tag < 0:
+                continue
+
+            buffer = buffer[fim_tag + 1:]
+            dentro = True
+
+        fim = buffer.find("</script>")
+        if fim >= 0:
+            return(json.loads(buffer[:fim]))
+
+    raise ValueError("Script __NEXT_DATA__ não encontrado na página")
+
+def _le_arquivo(path, chunk_size = 1 << 16):
+    with open(path, "r", encoding="utf-8") as f:
+        for chunk in iter(lambda: f.read(chunk_size), ""):
+            yield chunk
+
+def next_data_arquivo(path):
+    """
+        Extrai o '__NEXT_DATA__' de uma página HTML salva em disco
+    """
+    return(extrai_next_data(_le_arquivo(path)))
+
+def next_data_url(url, session = None, headers = None, timeout = 10):
+    """
+        Baixa uma página do SofaScore em streaming e extrai o '__NEXT_DATA__', fechando a conexão assim que o script termina
+    """
+    import requests
+
+    getter = session if session is not None else requests
+    resp = getter.get(url, headers=headers, stream=True, timeout=timeout)
+    try:
+        resp.raise_for_status()
+        resp.encoding = "UTF-8"
+        return(extrai_next_data(resp.iter_content(chunk_size=1 << 14, decode_unicode=True)))
+    finally:
+        resp.close()
+
+def seasons_de_next_data(next_data):
+    """
+        Retorna a lista de temporadas ({'name', 'year', 'id'}) do '__NEXT_DATA__' da página de um torneio
+    """
+    return(next_data['props']['initialProps']['pageProps']['seasons'])
+
+def _hash_seasons(seasons):
+    return(hashlib.sha256(json.dumps(seasons, sort_keys=True).encode()).hexdigest())
+
+def le_registro(registry_path = "seasons_registry.json"):
+    """
+        Lê o registro de temporadas. Retorna um registro vazio caso o arquivo não exista
+    """
+    if not os.path.exists(registry_path):
+        return({"last_refresh": None, "tournaments": {}})
+
+    with open(registry_path, "r", encoding="utf-8") as f:
+        return(json.load(f))
+
+def atualiza_registro(tournaments = TOURNAMENTS, registry_path = "seasons_registry.json", html_dir = None,
+                      session = None, headers = None, max_workers = 6, grava_ids = True, root = "."):
+    """
+        Busca as temporadas de todos os torneios configurados e junta em um único registro com a data da última atualização.
+        Apenas os torneios cuja lista de temporadas mudou são atualizados no registro (e nos arquivos 'IDs_*_seasons.json').
+        Um torneio com erro (página ausente, download ou JSON inválido) não impede a atualização dos demais e mantém no
+        registro a última lista de temporadas obtida.
+
+        Retorna a lista dos torneios atualizados e um dicionário {nome: erro} dos torneios com erro.
+
+        Parâmetros:
+              tournaments: Dicionário {nome: {'url', 'ids_file'}} dos torneios
+            registry_path: Arquivo JSON do registro de temporadas
+                 html_dir: Diretório com as páginas salvas ('<nome>.html'). Se informado, nada é baixado
+                  session: Sessão do 'requests' usada nos downloads
+                  headers: Headers das requisições
+              max_workers: Número de torneios buscados ao mesmo tempo
+                grava_ids: (Boolean) Também grava os arquivos 'IDs_*_seasons.json' usados no notebook de scrap
+                     root: Diretório onde ficam os arquivos 'IDs_*_seasons.json'
+    """
+    registro = le_registro(registry_path)
+
+    def busca(name):
+        try:
+            if html_dir is not None:
+                next_data = next_data_arquivo(os.path.join(html_dir, name + ".html"))
+            else:
+                next_data = next_data_url(tournaments[name]["url"], session=session, headers=headers)
+            return(name, seasons_de_next_data(next_data), None)
+        except Exception as e:
+            return(name, None, repr(e))
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        resultados = list(executor.map(busca, list(tournaments)))
+
+    agora = datetime.now().isoformat(timespec="seconds")
+    alterados = []
+    erros = {}
+
+    for name, seasons, erro in resultados:
+        if erro is not None:
+            erros[name] = erro
+            print("Erro ao buscar as temporadas de " + name + ": " + erro)
+            continue
+
+        h = _hash_seasons(seasons)
+        atual = registro["tournaments"].get(name)
+        if atual is not None and atual.get("hash") == h:
+            continue
+
+        registro["tournaments"][name] = {
+            "url": tournaments[name]["url"],
+            "ids_file": tournaments[name].get("ids_file"),
+            "seasons": seasons,
+            "hash": h,
+            "updated_at": agora
+        }
+        alterados.append(name)
+
+        if grava_ids and tournaments[name].get("ids_file"):
+            with open(os.path.join(root, tournaments[name]["ids_file"]), "w") as f:
+                json.dump(seasons, f)
+
+    if(len(erros) < len(resultados)):
+        registro["last_refresh"] = agora
+
+    tmp_path = registry_path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(registro, f, indent=2, ensure_ascii=False)
+    os.replace(tmp_path, registry_path)
+
+    return(alterados, erros)
+
+def id_temporadas(name, registry_path = "seasons_registry.json"):
+    """
+        Retorna o dicionário {ano: id da temporada} de um torneio, no formato usado no notebook de scrap
+
+        Parâmetros:
+                     name: Nome do torneio no registro (ex.: 'premier_league')
+            registry_path: Arquivo JSON do registro de temporadas
+    """
+    return({a['year']: a['id'] for a in le_registro(registry_path)["tournaments"][name]["seasons"]})
+
+def verifica_fixtures(html_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures", "sofascore")):
+    """
+        Verifica o fluxo offline com as páginas salvas em 'fixtures/sofascore': a primeira execução cria o registro com
+        todos os torneios, e a segunda não encontra nenhuma mudança. O registro e os arquivos de IDs são gravados em um
+        diretório temporário.
+
+        Parâmetros:
+            html_dir: Diretório com as páginas salvas ('<nome>.html')
+    """
+    import tempfile
+
+    # Marcadores divididos entre pedaços
+    for name in TOURNAMENTS:
+        path = os.path.join(html_dir, name + ".html")
+        assert extrai_next_data(_le_arquivo(path, chunk_size=7)) == next_data_arquivo(path), name
+
+    with tempfile.TemporaryDirectory() as tmp:
+        registry_path = os.path.join(tmp, "seasons_registry.json")
+
+        alterados, erros = atualiza_registro(registry_path=registry_path, html_dir=html_dir, root=tmp)
+        assert erros == {}, erros
+        assert sorted(alterados) == sorted(TOURNAMENTS), alterados
+
+        registro = le_registro(registry_path)
+        assert registro["last_refresh"] is not None
+        for name in TOURNAMENTS:
+            assert len(id_temporadas(name, registry_path)) > 0, name
+
+        alterados, erros = atualiza_registro(registry_path=registry_path, html_dir=html_dir, root=tmp)
+        assert alterados == [] and erros == {}, (alterados, erros)
+
+        # Um torneio sem página não impede a atualização dos demais
+        tournaments = dict(TOURNAMENTS, inexistente={"url": "", "ids_file": None})
+        alterados, erros = atualiza_registro(tournaments=tournaments, registry_path=registry_path, html_dir=html_dir, root=tmp)
+        assert alterados == [] and list(erros) == ["inexistente"], (alterados, erros)
+
+    print("OK")
+
+if __name__ == "__main__":
+    verifica_fixtures()